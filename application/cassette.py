@@ -0,0 +1,337 @@
+"""Record and replay chat sessions for offline performance regression runs.
+
+A cassette is gzip-compressed JSON lines: a header with the provider,
+model and tool catalog, then per turn the query, every LLM response and
+tool result with how long it took, and the turn's totals. Replaying
+serves those responses in place of the provider and the MCP servers, so
+the current code runs against a real session without a network.
+
+    uv run application/multi_server_chatbot.py --record run.cassette.gz
+    uv run application/cassette.py run.cassette.gz [--time-scale 0]
+"""
+import argparse
+import asyncio
+import contextlib
+import gzip
+import io
+import json
+import sys
+import time
+from collections import defaultdict, deque
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional
+
+from mcp import types
+
+from llm_adapter import LLMAdapter, ChatMessage, ChatResponse
+
+
+CASSETTE_VERSION = 1
+
+
+class CassetteMismatch(Exception):
+    """The code under replay asked for something the cassette did not record"""
+
+
+@dataclass(slots=True)
+class RecordedFunction:
+    name: str
+    arguments: str
+
+
+@dataclass(slots=True)
+class RecordedToolCall:
+    """Stand-in for the SDK's tool call objects, with the attributes the chatbot reads"""
+    id: str
+    function: RecordedFunction
+    type: str = "function"
+
+    def model_dump(self) -> Dict[str, Any]:
+        return {"id": self.id, "type": self.type,
+                "function": {"name": self.function.name, "arguments": self.function.arguments}}
+
+
+def response_to_dict(response: ChatResponse) -> Dict[str, Any]:
+    data: Dict[str, Any] = {"content": response.content}
+    if response.tool_calls:
+        data["tool_calls"] = [{
+            "id": call.id,
+            "name": call.function.name,
+            "arguments": call.function.arguments
+        } for call in response.tool_calls]
+    if response.usage:
+        data["usage"] = {key: response.usage.get(key, 0) for key in ("prompt_tokens", "completion_tokens")}
+    return data
+
+
+def response_from_dict(data: Dict[str, Any]) -> ChatResponse:
+    tool_calls = [
+        RecordedToolCall(id=call["id"], function=RecordedFunction(call["name"], call["arguments"]))
+        for call in data.get("tool_calls", [])
+    ]
+    return ChatResponse(content=data.get("content"), tool_calls=tool_calls or None, usage=data.get("usage"))
+
+
+def tool_key(tool_name: str, tool_args: Optional[dict]) -> str:
+    return f"{tool_name}:{json.dumps(tool_args or {}, sort_keys=True)}"
+
+
+class CassetteRecorder:
+    """Collects one turn's traffic and appends it to the cassette when the turn ends.
+
+    Each turn is written as its own gzip member, so a crash loses at most
+    the turn in progress.
+    """
+
+    def __init__(self, path: str, provider: str, model: str):
+        self.path = path
+        self.provider = provider
+        self.model = model
+        self._header_written = False
+        self._records: List[dict] = []
+        self._turn = 0
+        self._turn_started = 0.0
+
+    def start_turn(self, query: str, tools: List[dict]) -> None:
+        if not self._header_written:
+            self._records.append({
+                "cassette": CASSETTE_VERSION,
+                "provider": self.provider,
+                "model": self.model,
+                "created": time.time(),
+                "tools": tools
+            })
+            self._header_written = True
+        self._turn += 1
+        self._turn_started = time.perf_counter()
+        self._records.append({"turn": self._turn, "query": query})
+
+    def llm(self, response: ChatResponse, elapsed: float) -> None:
+        self._records.append({"llm": response_to_dict(response), "ms": round(elapsed * 1000, 3)})
+
+    def tool(self, tool_name: str, tool_args: dict, elapsed: float, result=None, error: Optional[str] = None) -> None:
+        record = {"tool": tool_name, "args": tool_args, "ms": round(elapsed * 1000, 3)}
+        if error is not None:
+            record["error"] = error
+        else:
+            record["result"] = result.model_dump(mode="json", exclude_none=True)
+        self._records.append(record)
+
+    def end_turn(self, input_tokens: int, output_tokens: int, cancelled: bool = False) -> None:
+        self._records.append({
+            "end": self._turn,
+            "ms": round((time.perf_counter() - self._turn_started) * 1000, 3),
+            "input_tokens": input_tokens,
+            "output_tokens": output_tokens,
+            "cancelled": cancelled
+        })
+        records, self._records = self._records, []
+        with gzip.open(self.path, "at", encoding="utf-8") as file:
+            file.write("".join(json.dumps(record, separators=(",", ":")) + "\n" for record in records))
+
+
+@dataclass
+class RecordedTurn:
+    query: str
+    llm: List[dict] = field(default_factory=list)
+    tools: List[dict] = field(default_factory=list)
+    ms: float = 0.0
+    input_tokens: int = 0
+    output_tokens: int = 0
+    cancelled: bool = False
+
+
+@dataclass
+class Cassette:
+    provider: str
+    model: str
+    tools: List[dict]
+    turns: List[RecordedTurn]
+
+    @classmethod
+    def load(cls, path: str) -> "Cassette":
+        header, turns = None, []
+        with gzip.open(path, "rt", encoding="utf-8") as file:
+            for line in file:
+                record = json.loads(line)
+                if "cassette" in record:
+                    if record["cassette"] != CASSETTE_VERSION:
+                        raise ValueError(f"Unsupported cassette version {record['cassette']}")
+                    header = header or record
+                elif "turn" in record:
+                    turns.append(RecordedTurn(query=record["query"]))
+                elif "llm" in record:
+                    turns[-1].llm.append(record)
+                elif "tool" in record:
+                    turns[-1].tools.append(record)
+                elif "end" in record:
+                    turns[-1].ms = record["ms"]
+                    turns[-1].input_tokens = record["input_tokens"]
+                    turns[-1].output_tokens = record["output_tokens"]
+                    turns[-1].cancelled = record["cancelled"]
+        if header is None:
+            raise ValueError(f"{path} is not a cassette")
+        return cls(provider=header["provider"], model=header["model"], tools=header["tools"], turns=turns)
+
+
+class ReplayAdapter(LLMAdapter):
+    """Serves one turn's recorded responses in order, after their recorded (scaled) latency"""
+
+    def __init__(self, cassette: Cassette, time_scale: float = 1.0):
+        super().__init__(cassette.model, enable_caching=False)
+        self.cassette = cassette
+        self.time_scale = time_scale
+        self.calls = 0
+        self._pending: deque = deque()
+
+    def start_turn(self, turn: RecordedTurn) -> None:
+        self._pending = deque(turn.llm)
+        self.calls = 0
+
+    async def chat_completion(
+        self,
+        messages: List[ChatMessage],
+        tools: Optional[List[Dict]] = None,
+        max_tokens: int = 2048,
+        temperature: float = 0.7,
+        **kwargs
+    ) -> ChatResponse:
+        if not self._pending:
+            raise CassetteMismatch(f"LLM call {self.calls + 1} was not recorded for this turn")
+        record = self._pending.popleft()
+        self.calls += 1
+        await asyncio.sleep(record["ms"] / 1000 * self.time_scale)
+        return response_from_dict(record["llm"])
+
+    def get_available_models(self) -> List[str]:
+        return [self.cassette.model]
+
+    @property
+    def provider_name(self) -> str:
+        return f"Replay ({self.cassette.provider})"
+
+    @property
+    def supports_caching(self) -> bool:
+        return False
+
+    @property
+    def requires_manual_cache_control(self) -> bool:
+        return False
+
+
+class ReplaySession:
+    """Answers call_tool from a turn's recorded results, matched by tool name and arguments"""
+
+    def __init__(self, time_scale: float = 1.0):
+        self.time_scale = time_scale
+        self.calls = 0
+        # MCP_ChatBot.call_tool reads these to cancel requests
+        self._request_id = 0
+        self._results: Dict[str, deque] = {}
+
+    def start_turn(self, turn: RecordedTurn) -> None:
+        self._results = defaultdict(deque)
+        for record in turn.tools:
+            self._results[tool_key(record["tool"], record["args"])].append(record)
+        self.calls = 0
+
+    async def call_tool(self, name: str, arguments: Optional[dict] = None) -> types.CallToolResult:
+        records = self._results.get(tool_key(name, arguments))
+        if not records:
+            raise CassetteMismatch(f"No recorded result for {name} with args {arguments}")
+        record = records.popleft()
+        self.calls += 1
+        await asyncio.sleep(record["ms"] / 1000 * self.time_scale)
+        if "error" in record:
+            raise RuntimeError(record["error"])
+        return types.CallToolResult.model_validate(record["result"])
+
+    async def send_notification(self, notification) -> None:
+        pass
+
+
+async def replay(cassette: Cassette, time_scale: float = 1.0, quiet: bool = True) -> List[dict]:
+    """Run every completed turn of cassette through the current MCP_ChatBot and compare"""
+    from multi_server_chatbot import MCP_ChatBot
+
+    adapter = ReplayAdapter(cassette, time_scale)
+    session = ReplaySession(time_scale)
+    chatbot = MCP_ChatBot(llm_adapter=adapter)
+    chatbot._set_server_tools("replay", cassette.tools)
+    for tool in cassette.tools:
+        chatbot.tool_to_session[tool["function"]["name"]] = session
+
+    reports = []
+    for number, turn in enumerate(cassette.turns, 1):
+        report = {"turn": number, "query": turn.query, "recorded_ms": turn.ms,
+                  "recorded_input_tokens": turn.input_tokens, "recorded_output_tokens": turn.output_tokens}
+        if turn.cancelled:
+            # The live turn was rolled back, so it never reached later turns' history
+            reports.append({**report, "status": "skipped (cancelled when recorded)"})
+            continue
+
+        adapter.start_turn(turn)
+        session.start_turn(turn)
+        input_tokens, output_tokens = chatbot.total_input_tokens, chatbot.total_output_tokens
+        start = time.perf_counter()
+        try:
+            with contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext():
+                await chatbot.process_query(turn.query)
+            status = "ok"
+            if adapter._pending:
+                status = f"mismatch: {len(adapter._pending)} recorded LLM calls unused"
+        except CassetteMismatch as e:
+            status = f"mismatch: {e}"
+        except Exception as e:
+            # As in the live chat loop: the turn fails, the session goes on
+            status = f"error: {type(e).__name__}: {e}"
+        reports.append({
+            **report,
+            "status": status,
+            "replay_ms": round((time.perf_counter() - start) * 1000, 3),
+            "replay_input_tokens": chatbot.total_input_tokens - input_tokens,
+            "replay_output_tokens": chatbot.total_output_tokens - output_tokens,
+            "llm_calls": adapter.calls,
+            "recorded_llm_calls": len(turn.llm),
+            "tool_calls": session.calls
+        })
+    return reports
+
+
+def print_report(reports: List[dict], time_scale: float) -> None:
+    print(f"{'turn':>4}  {'expected':>10}  {'replay':>10}  {'Δ ms':>9}  {'Δ in tok':>8}  {'Δ out tok':>9}  status")
+    for report in reports:
+        if "replay_ms" not in report:
+            print(f"{report['turn']:>4}  {report['recorded_ms']:>8.0f}ms  {'-':>10}  {'-':>9}  {'-':>8}  {'-':>9}  {report['status']}")
+            continue
+        # Compare against what the recorded latency becomes at this time scale
+        expected = report["recorded_ms"] * time_scale
+        print(
+            f"{report['turn']:>4}  {expected:>8.0f}ms  {report['replay_ms']:>8.0f}ms  "
+            f"{report['replay_ms'] - expected:>+9.1f}  "
+            f"{report['replay_input_tokens'] - report['recorded_input_tokens']:>+8}  "
+            f"{report['replay_output_tokens'] - report['recorded_output_tokens']:>+9}  {report['status']}"
+        )
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description="Replay a recorded session against the current code")
+    parser.add_argument("cassette", help="file written with multi_server_chatbot.py --record")
+    parser.add_argument("--time-scale", type=float, default=1.0,
+                        help="multiply recorded LLM/tool latency (0 = no waiting)")
+    parser.add_argument("--json", action="store_true", help="print the per-turn report as JSON")
+    parser.add_argument("--verbose", action="store_true", help="show the chatbot's output")
+    args = parser.parse_args()
+
+    cassette = Cassette.load(args.cassette)
+    reports = asyncio.run(replay(cassette, args.time_scale, quiet=not args.verbose))
+    if args.json:
+        print(json.dumps(reports, indent=2))
+    else:
+        print(f"{cassette.provider} / {cassette.model}: {len(cassette.turns)} turns at time scale {args.time_scale:g}")
+        print_report(reports, args.time_scale)
+    return 1 if any(report["status"].startswith("mismatch") for report in reports) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
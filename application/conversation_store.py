@@ -0,0 +1,166 @@
+import asyncio
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, List, Optional
+
+from llm_adapter import ChatMessage
+
+
+SESSION_ID_PATTERN = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+def message_to_dict(message: ChatMessage) -> Dict[str, Any]:
+    data = {"role": message.role, "content": message.content}
+    if message.tool_calls:
+        data["tool_calls"] = [
+            call.model_dump() if hasattr(call, "model_dump") else call for call in message.tool_calls
+        ]
+    if message.tool_call_id:
+        data["tool_call_id"] = message.tool_call_id
+    return data
+
+
+def message_from_dict(data: Dict[str, Any]) -> ChatMessage:
+    return ChatMessage(
+        role=data["role"],
+        content=data.get("content"),
+        tool_calls=data.get("tool_calls"),
+        tool_call_id=data.get("tool_call_id"),
+    )
+
+
+class ConversationStore:
+    """Durable chat histories: a compact snapshot plus an append-only log per session.
+
+    <id>.snapshot.json holds {"generation": g, "messages": [...]} and
+    <id>.<g>.log holds the JSON records written since. A record either
+    appends one message or resets the history to a list of messages.
+    Writes are batched and done on a single background thread, so the
+    event loop never waits on disk and records land in order.
+    """
+
+    def __init__(self, directory: str = "sessions", flush_delay: float = 0.5, snapshot_every: int = 200):
+        self.directory = directory
+        self.flush_delay = flush_delay
+        self.snapshot_every = snapshot_every
+        self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="conversation-store")
+        self._pending: Dict[str, List[dict]] = {}
+        self._flush_task: Optional[asyncio.Task] = None
+        # What each session's files already contain: (message count, last message object)
+        self._persisted: Dict[str, tuple] = {}
+        # Writer-thread state: (snapshot generation, records in its log) per session
+        self._log_state: Dict[str, tuple] = {}
+
+    def _check_id(self, session_id: str) -> None:
+        if not SESSION_ID_PATTERN.match(session_id):
+            raise ValueError(f"Invalid session id: {session_id!r}")
+
+    def _snapshot_path(self, session_id: str) -> str:
+        return os.path.join(self.directory, f"{session_id}.snapshot.json")
+
+    def _log_path(self, session_id: str, generation: int) -> str:
+        return os.path.join(self.directory, f"{session_id}.{generation}.log")
+
+    def _read(self, session_id: str) -> tuple:
+        """Snapshot generation, messages as dicts, and record count of the current log"""
+        try:
+            with open(self._snapshot_path(session_id), "r") as file:
+                snapshot = json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            snapshot = {"generation": 0, "messages": []}
+
+        generation, messages, records = snapshot["generation"], snapshot["messages"], 0
+        try:
+            with open(self._log_path(session_id, generation), "r") as file:
+                for line in file:
+                    try:
+                        record = json.loads(line)
+                    except json.JSONDecodeError:
+                        break  # torn final write
+                    records += 1
+                    if record["op"] == "append":
+                        messages.append(record["message"])
+                    elif record["op"] == "reset":
+                        messages = record["messages"]
+        except FileNotFoundError:
+            pass
+        return generation, messages, records
+
+    def _write(self, batches: Dict[str, List[dict]]) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        for session_id, records in batches.items():
+            if session_id not in self._log_state:
+                generation, _, count = self._read(session_id)
+            else:
+                generation, count = self._log_state[session_id]
+            with open(self._log_path(session_id, generation), "a") as file:
+                file.write("".join(json.dumps(record) + "\n" for record in records))
+            count += len(records)
+            if count >= self.snapshot_every:
+                generation, count = self._compact(session_id), 0
+            self._log_state[session_id] = (generation, count)
+
+    def _compact(self, session_id: str) -> int:
+        """Fold the log into a new snapshot generation, drop the old log, return the new generation"""
+        generation, messages, _ = self._read(session_id)
+        snapshot_path = self._snapshot_path(session_id)
+        with open(snapshot_path + ".tmp", "w") as file:
+            json.dump({"generation": generation + 1, "messages": messages}, file)
+        os.replace(snapshot_path + ".tmp", snapshot_path)
+        try:
+            os.remove(self._log_path(session_id, generation))
+        except FileNotFoundError:
+            pass
+        return generation + 1
+
+    def _load(self, session_id: str) -> List[dict]:
+        generation, messages, count = self._read(session_id)
+        self._log_state[session_id] = (generation, count)
+        return messages
+
+    def record(self, session_id: str, history: List[ChatMessage]) -> None:
+        """Queue whatever changed in history since the last call; written shortly after"""
+        self._check_id(session_id)
+        count, last = self._persisted.get(session_id, (0, None))
+        if count <= len(history) and (count == 0 or history[count - 1] is last):
+            records = [{"op": "append", "message": message_to_dict(m)} for m in history[count:]]
+        else:
+            # History was cleared or rolled back: rewrite it in one record
+            records = [{"op": "reset", "messages": [message_to_dict(m) for m in history]}]
+        if not records:
+            return
+
+        self._persisted[session_id] = (len(history), history[-1] if history else None)
+        self._pending.setdefault(session_id, []).extend(records)
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.get_running_loop().create_task(self._delayed_flush())
+
+    async def _delayed_flush(self) -> None:
+        # Records queued while a write was running find this task not done, so loop for them
+        while self._pending:
+            await asyncio.sleep(self.flush_delay)
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all queued records now"""
+        if not self._pending:
+            return
+        batches, self._pending = self._pending, {}
+        await asyncio.get_running_loop().run_in_executor(self._executor, self._write, batches)
+
+    async def load(self, session_id: str) -> List[ChatMessage]:
+        """Rebuild a session's history from its snapshot and log"""
+        self._check_id(session_id)
+        await self.flush()
+        messages = await asyncio.get_running_loop().run_in_executor(self._executor, self._load, session_id)
+        history = [message_from_dict(m) for m in messages]
+        self._persisted[session_id] = (len(history), history[-1] if history else None)
+        return history
+
+    async def close(self) -> None:
+        if self._flush_task:
+            self._flush_task.cancel()
+        await self.flush()
+        self._executor.shutdown(wait=True)
@@ -1,13 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Callable
 from dataclasses import dataclass
 
 
-@dataclass
+@dataclass(slots=True)
 class CacheControl:
     type: str = "ephemeral"
 
-@dataclass
+@dataclass(slots=True)
 class ChatMessage:
     role: str
     content: Optional[str] = None
@@ -16,13 +16,49 @@ class ChatMessage:
     cache_control: Optional[CacheControl] = None
 
 
-@dataclass
+@dataclass(slots=True)
 class ChatResponse:
     content: Optional[str]
     tool_calls: Optional[List[Any]] = None
     usage: Optional[Dict[str, int]] = None
 
 
+class MessageBuffer:
+    """Wire-format messages for one conversation, converted incrementally.
+    
+    Messages are matched by identity, so a list that only grew since the
+    last call converts just the appended tail, and a replaced message is
+    converted again along with everything after it. Messages must not be
+    mutated in place once sent.
+    """
+    __slots__ = ("sources", "wire")
+    
+    def __init__(self):
+        self.sources: List[ChatMessage] = []
+        self.wire: List[Dict[str, Any]] = []
+    
+    def sync(self, messages: List[ChatMessage], convert: Callable[[ChatMessage], Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """Bring the buffer in line with messages and return the wire list"""
+        sources = self.sources
+        # Identity checks are cheap next to conversion, so compare the whole prefix:
+        # checking only the last message would miss one replaced in the middle
+        n = 0
+        for old, new in zip(sources, messages):
+            if old is not new:
+                break
+            n += 1
+        if n < len(sources):
+            # History was rewritten (rolled back, cleared, edited) - keep the common prefix
+            del sources[n:]
+            del self.wire[n:]
+        
+        for msg in messages[n:]:
+            sources.append(msg)
+            self.wire.append(convert(msg))
+        # A copy: the request may still hold it while another sync edits the buffer
+        return list(self.wire)
+
+
 class LLMAdapter(ABC):
     """Abstract base class for LLM adapters"""
     
@@ -44,6 +80,10 @@ class LLMAdapter(ABC):
         """Generate a chat completion"""
         pass
     
+    def end_conversation(self, conversation_id: Optional[str]) -> None:
+        """Drop any per-conversation state kept for conversation_id"""
+        pass
+    
     @abstractmethod
     def get_available_models(self) -> List[str]:
         """Get list of available models for this provider"""
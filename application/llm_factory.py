@@ -1,28 +1,39 @@
-from typing import Dict, Type
+import importlib
+from typing import Dict, Type, Union
 from llm_adapter import LLMAdapter
-from openai_adapter import OpenAIAdapter, OpenRouterAdapter
 
 
 class LLMFactory:
     """Factory for creating LLM adapters"""
     
-    _adapters: Dict[str, Type[LLMAdapter]] = {
-        "openai": OpenAIAdapter,
-        "openrouter": OpenRouterAdapter,
+    # Adapters are registered as "module:Class" and imported on first use,
+    # so importing the factory doesn't pull in every provider SDK
+    _adapters: Dict[str, Union[str, Type[LLMAdapter]]] = {
+        "openai": "openai_adapter:OpenAIAdapter",
+        "openrouter": "openai_adapter:OpenRouterAdapter",
     }
     
+    @classmethod
+    def _resolve(cls, provider: str) -> Type[LLMAdapter]:
+        adapter_class = cls._adapters[provider]
+        if isinstance(adapter_class, str):
+            module_name, class_name = adapter_class.split(":")
+            adapter_class = getattr(importlib.import_module(module_name), class_name)
+            cls._adapters[provider] = adapter_class
+        return adapter_class
+    
     @classmethod
     def create_adapter(cls, provider: str, model: str, **kwargs) -> LLMAdapter:
         """Create an adapter instance"""
         if provider not in cls._adapters:
             raise ValueError(f"Unknown provider: {provider}. Available: {list(cls._adapters.keys())}")
         
-        adapter_class = cls._adapters[provider]
+        adapter_class = cls._resolve(provider)
         return adapter_class(model=model, **kwargs)
     
     @classmethod
-    def register_adapter(cls, name: str, adapter_class: Type[LLMAdapter]):
-        """Register a new adapter type"""
+    def register_adapter(cls, name: str, adapter_class: Union[str, Type[LLMAdapter]]):
+        """Register a new adapter type, either a class or a lazy "module:Class" path"""
         cls._adapters[name] = adapter_class
     
     @classmethod
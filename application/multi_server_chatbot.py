@@ -1,30 +1,100 @@
 from dotenv import load_dotenv
-from mcp import ClientSession, StdioServerParameters
+from mcp import ClientSession, StdioServerParameters, types
 from mcp.client.stdio import stdio_client
-from typing import List, Dict, TypedDict, Optional
-from contextlib import AsyncExitStack
+from typing import Awaitable, Callable, List, Dict, TypedDict, Optional
+from collections import Counter
+from dataclasses import dataclass
+import copy
+import hashlib
 import json
 import asyncio
 import os
 import sys
+import time
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
 from llm_adapter import LLMAdapter, ChatMessage
 from llm_factory import LLMFactory, LLM_CONFIGS
+from conversation_store import ConversationStore
+from cassette import CassetteRecorder
 
 load_dotenv()
 
+CATALOG_SNAPSHOT = ".mcp_tool_catalog.json"
+
+
+def server_fingerprint(server_config: dict) -> str:
+    """Hash of how a server is launched; local script args include their mtime so code edits count"""
+    args = server_config.get("args", [])
+    parts = {
+        "command": server_config.get("command"),
+        "args": args,
+        "env": server_config.get("env"),
+        "files": {arg: os.path.getmtime(arg) for arg in args if os.path.isfile(arg)},
+    }
+    return hashlib.sha256(json.dumps(parts, sort_keys=True).encode()).hexdigest()
+
+
 class ToolDefinition(TypedDict):
     name: str
     description: str
     input_schema: dict
 
+def _text_items(result) -> List[str]:
+    """Text parts of a tool result; a JSON list in a single part is flattened"""
+    texts = [item.text for item in result.content if getattr(item, "type", None) == "text"]
+    if len(texts) == 1:
+        try:
+            parsed = json.loads(texts[0])
+        except json.JSONDecodeError:
+            return texts
+        if isinstance(parsed, list):
+            return [str(item) for item in parsed]
+    return texts
+
+
+# Follow-up calls the model usually makes after a tool result, warmed while it thinks:
+# tool name -> function(result texts) -> [(tool name, arguments)]
+PREFETCH_RULES = {
+    "search_papers": lambda paper_ids: [("extract_info", {"paper_id": paper_id}) for paper_id in paper_ids],
+}
+
+# Async callback(tool_name, tool_args, content) for each tool result of a turn
+ToolResultCallback = Callable[[str, dict, str], Awaitable[None]]
+
+
+@dataclass(slots=True)
+class TurnBudget:
+    """Limits for one turn of the agent loop; None disables a limit.
+    
+    When a limit is hit the bot stops calling tools and makes one final
+    call with tools disabled to answer from what it has gathered.
+    """
+    max_tool_iterations: Optional[int] = 10
+    deadline: Optional[float] = 180.0
+    max_input_tokens: Optional[int] = 300_000
+    max_output_tokens: Optional[int] = 20_000
+    # The final answer gets its own allowance, so a breached turn still ends promptly
+    synthesis_timeout: float = 30.0
+    synthesis_max_tokens: int = 1024
+
+
 class MCP_ChatBot:
 
-    def __init__(self, llm_adapter: Optional[LLMAdapter] = None):
+    def __init__(self, llm_adapter: Optional[LLMAdapter] = None, prefetch_budget: int = 5,
+                 catalog_path: str = CATALOG_SNAPSHOT, store: Optional[ConversationStore] = None,
+                 recorder: Optional[CassetteRecorder] = None, budget: Optional[TurnBudget] = None):
         # Initialize session and client objects
         self.sessions: List[ClientSession] = []
-        self.exit_stack = AsyncExitStack()
+        # Each server connection lives in its own task until _shutdown is set
+        self._shutdown = asyncio.Event()
+        self._server_tasks: Dict[str, asyncio.Task] = {}
+        self._server_ready: Dict[str, asyncio.Future] = {}
+        self._revalidate_task: Optional[asyncio.Task] = None
+        self.server_configs: Dict[str, dict] = {}
+        self.server_versions: Dict[str, Optional[str]] = {}
+        # Tool catalog snapshot, used to answer before servers have started
+        self.catalog_path = catalog_path
         
         # Use provided adapter or default to OpenRouter with gpt-4.1-mini
         if llm_adapter:
@@ -34,54 +104,163 @@ class MCP_ChatBot:
             self.llm_adapter = LLMFactory.create_adapter(**config)
             
         self.available_tools: List[ToolDefinition] = []
+        self.server_tools: Dict[str, List[ToolDefinition]] = {}
+        self.tool_to_server: Dict[str, str] = {}
         self.tool_to_session: Dict[str, ClientSession] = {}
         # Multi-turn conversation state
         self.conversation_history: List[ChatMessage] = []
+        # Optional durable history; set session_id via resume()
+        self.store = store
+        self.session_id: Optional[str] = None
         self.total_input_tokens = 0
         self.total_output_tokens = 0
+        # Per-turn limits on tool iterations, wall time and tokens
+        self.budget = budget or TurnBudget()
+        # Optional capture of LLM and tool traffic for offline replay
+        self.recorder = recorder
+        # Counters for work that was started but not used (cancelled turns, etc.)
+        self.metrics: Counter = Counter()
+        # The turn's LLM or tool call in progress ("llm"/"tool"), to count it if the turn is cancelled
+        self._turn_call: Optional[str] = None
+        # Speculative tool calls started this turn, keyed by _tool_key
+        self.prefetch_budget = prefetch_budget
+        self._prefetched: Dict[str, asyncio.Task] = {}
+        self._prefetch_remaining = 0
 
-    async def connect_to_server(self, server_name: str, server_config: dict) -> None:
-        """Connect to a single MCP server."""
+    def _load_catalog(self) -> dict:
+        try:
+            with open(self.catalog_path, "r") as file:
+                return json.load(file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return {}
+
+    def _save_catalog(self, server_name: str, server_config: dict, version: Optional[str]) -> None:
+        """Record a server's tools so the next start can skip spawning it"""
+        catalog = self._load_catalog()
+        catalog[server_name] = {
+            "fingerprint": server_fingerprint(server_config),
+            "version": version,
+            "tools": self.server_tools[server_name],
+        }
+        tmp_path = self.catalog_path + ".tmp"
+        with open(tmp_path, "w") as file:
+            json.dump(catalog, file, indent=2)
+        os.replace(tmp_path, self.catalog_path)
+
+    def _set_server_tools(self, server_name: str, tools: List[ToolDefinition]) -> None:
+        for tool_name in [name for name, owner in self.tool_to_server.items() if owner == server_name]:
+            del self.tool_to_server[tool_name]
+            self.tool_to_session.pop(tool_name, None)
+        self.server_tools[server_name] = tools
+        for tool in tools:
+            self.tool_to_server[tool["function"]["name"]] = server_name
+        # In place, so forks sharing the list see the change
+        self.available_tools[:] = [tool for server in self.server_tools.values() for tool in server]
+
+    async def _run_server(self, server_name: str, server_config: dict, ready: asyncio.Future) -> None:
+        """Own one server connection for its whole life, so it is opened and closed in the same task"""
         try:
             server_params = StdioServerParameters(**server_config)
-            stdio_transport = await self.exit_stack.enter_async_context(
-                stdio_client(server_params)
-            )
-            read, write = stdio_transport
-            session = await self.exit_stack.enter_async_context(
-                ClientSession(read, write)
+            async with stdio_client(server_params) as (read, write):
+                async with ClientSession(read, write) as session:
+                    init_result = await session.initialize()
+                    ready.set_result((session, init_result.serverInfo.version))
+                    await self._shutdown.wait()
+        except Exception as e:
+            if not ready.done():
+                ready.set_exception(e)
+            else:
+                print(f"Connection to {server_name} closed: {e}", file=sys.stderr)
+
+    async def _ensure_connected(self, server_name: str) -> ClientSession:
+        """Start a server on first use; concurrent callers share one spawn"""
+        ready = self._server_ready.get(server_name)
+        if ready is None or (ready.done() and ready.exception() is not None):
+            ready = asyncio.get_running_loop().create_future()
+            self._server_ready[server_name] = ready
+            self._server_tasks[server_name] = asyncio.create_task(
+                self._run_server(server_name, self.server_configs[server_name], ready)
             )
-            await session.initialize()
+        # Shielded: a cancelled turn must not tear down a connection others will reuse
+        session, version = await asyncio.shield(ready)
+        self.server_versions[server_name] = version
+        if session not in self.sessions:
             self.sessions.append(session)
+            for tool_name, owner in self.tool_to_server.items():
+                if owner == server_name:
+                    self.tool_to_session[tool_name] = session
+        return session
+
+    async def session_for(self, tool_name: str) -> ClientSession:
+        """Session serving tool_name, spawning its server if it is still lazy"""
+        session = self.tool_to_session.get(tool_name)
+        if session is None:
+            session = await self._ensure_connected(self.tool_to_server[tool_name])
+        return session
+
+    async def connect_to_server(self, server_name: str, server_config: dict) -> None:
+        """Connect to a single MCP server and refresh its tool catalog."""
+        try:
+            self.server_configs[server_name] = server_config
+            session = await self._ensure_connected(server_name)
             
             # List available tools for this session
             response = await session.list_tools()
             tools = response.tools
             print(f"\nConnected to {server_name} with tools:", [t.name for t in tools])
             
+            self._set_server_tools(server_name, [{
+                "type": "function",
+                "function": {
+                    "name": tool.name,
+                    "description": tool.description,
+                    "parameters": tool.inputSchema
+                }
+            } for tool in tools])
             for tool in tools:
                 self.tool_to_session[tool.name] = session
-                self.available_tools.append({
-                    "type": "function",
-                    "function": {
-                        "name": tool.name,
-                        "description": tool.description,
-                        "parameters": tool.inputSchema
-                    }
-                })
+            self._save_catalog(server_name, server_config, self.server_versions.get(server_name))
         except Exception as e:
             print(f"Failed to connect to {server_name}: {e}")
 
-    async def connect_to_servers(self):
-        """Connect to all configured MCP servers."""
+    def load_cached_server(self, server_name: str, server_config: dict) -> bool:
+        """Serve a server's tools from the snapshot without spawning it, if the snapshot matches"""
+        entry = self._load_catalog().get(server_name)
+        if not entry or entry.get("fingerprint") != server_fingerprint(server_config):
+            return False
+        self.server_configs[server_name] = server_config
+        self._set_server_tools(server_name, entry["tools"])
+        print(f"\nLoaded {server_name} tools from snapshot:", [t["function"]["name"] for t in entry["tools"]])
+        return True
+
+    async def revalidate_catalog(self, server_names: List[str]) -> None:
+        """Connect snapshot-served servers in the background and pick up tool changes"""
+        for server_name in server_names:
+            if server_name in self.server_configs:
+                await self.connect_to_server(server_name, self.server_configs[server_name])
+
+    async def connect_to_servers(self, servers: Optional[dict] = None, lazy: bool = True):
+        """Connect to all configured MCP servers.
+        
+        With lazy=True, servers whose snapshot is still valid are not spawned
+        up front: their cached tools are available immediately and the
+        catalog is revalidated in the background.
+        """
         try:
-            with open("server_config.json", "r") as file:
-                data = json.load(file)
-            
-            servers = data.get("mcpServers", {})
+            if servers is None:
+                with open("server_config.json", "r") as file:
+                    data = json.load(file)
+                servers = data.get("mcpServers", {})
             
+            cached = []
             for server_name, server_config in servers.items():
-                await self.connect_to_server(server_name, server_config)
+                if lazy and self.load_cached_server(server_name, server_config):
+                    cached.append(server_name)
+                else:
+                    await self.connect_to_server(server_name, server_config)
+            
+            if cached:
+                self._revalidate_task = asyncio.create_task(self.revalidate_catalog(cached))
                 
             print(f"\nTotal tools available: {len(self.available_tools)}")
             print("Tool names:", [tool["function"]["name"] for tool in self.available_tools])
@@ -108,70 +287,302 @@ class MCP_ChatBot:
         
         print(f"🔢 Tokens: {input_str}/{output_str} (Total: {total_input_str}/{total_output_str})")
 
-    async def process_query(self, query):
-        # Add user message to conversation history
-        self.conversation_history.append(ChatMessage(role='user', content=query))
+    async def call_tool(self, tool_name: str, tool_args: dict):
+        """Call a tool on its server, telling the server to stop if we are cancelled"""
+        session = await self.session_for(tool_name)
+        # send_request assigns this id synchronously, before its first await
+        request_id = session._request_id
+        start = time.perf_counter()
+        try:
+            result = await session.call_tool(tool_name, arguments=tool_args)
+        except asyncio.CancelledError:
+            # Counted by whoever cancelled: process_query for the turn's calls, discard_prefetches for speculation
+            notification = types.ClientNotification(types.CancelledNotification(
+                method="notifications/cancelled",
+                params=types.CancelledNotificationParams(requestId=request_id, reason="Turn cancelled by client")
+            ))
+            try:
+                await asyncio.shield(session.send_notification(notification))
+            except Exception as e:
+                print(f"Failed to send cancellation for {tool_name}: {e}", file=sys.stderr)
+            raise
+        except Exception as e:
+            if self.recorder:
+                self.recorder.tool(tool_name, tool_args, time.perf_counter() - start, error=str(e))
+            raise
+        if self.recorder:
+            self.recorder.tool(tool_name, tool_args, time.perf_counter() - start, result=result)
+        return result
+
+    @staticmethod
+    def _tool_key(tool_name: str, tool_args: dict) -> str:
+        return f"{tool_name}:{json.dumps(tool_args, sort_keys=True)}"
+
+    def prefetch_follow_ups(self, tool_name: str, result) -> None:
+        """Start the calls PREFETCH_RULES predicts after this result, within the turn's budget"""
+        rule = PREFETCH_RULES.get(tool_name)
+        if rule is None or result.isError:
+            return
         
-        # Use full conversation history for context
-        messages = self.conversation_history.copy()
+        for next_tool, next_args in rule(_text_items(result)):
+            if self._prefetch_remaining <= 0:
+                return
+            key = self._tool_key(next_tool, next_args)
+            if next_tool not in self.tool_to_server or key in self._prefetched:
+                continue
+            task = asyncio.create_task(self.call_tool(next_tool, next_args))
+            # Speculation may fail unobserved; retrieve the error so asyncio doesn't log it
+            task.add_done_callback(lambda t: t.cancelled() or t.exception())
+            self._prefetched[key] = task
+            self._prefetch_remaining -= 1
+            self.metrics['prefetch_started'] += 1
+
+    async def call_tool_cached(self, tool_name: str, tool_args: dict):
+        """Use a prefetched result if there is one, otherwise call the tool"""
+        task = self._prefetched.pop(self._tool_key(tool_name, tool_args), None)
+        if task is None:
+            return await self.call_tool(tool_name, tool_args)
+        self.metrics['prefetch_hits'] += 1
+        return await task
+
+    def discard_prefetches(self) -> None:
+        """Cancel speculation the model never asked for and count it as wasted"""
+        for task in self._prefetched.values():
+            self.metrics['prefetch_wasted'] += 1
+            task.cancel()
+        self._prefetched = {}
+
+    async def chat_completion(self, messages: List[ChatMessage], max_tokens: int = 2024, **kwargs):
+        """Request a completion and track its token usage"""
+        start = time.perf_counter()
+        self._turn_call = "llm"
         response = await self.llm_adapter.chat_completion(
             messages=messages,
             tools=self.available_tools,
-            max_tokens=2024
+            max_tokens=max_tokens,
+            conversation_id=self.session_id,
+            **kwargs
         )
+        self._turn_call = None
+        if self.recorder:
+            self.recorder.llm(response, time.perf_counter() - start)
         
-        # Track token usage
         if response.usage:
             self.print_token_usage(response.usage.get('prompt_tokens', 0), response.usage.get('completion_tokens', 0))
+        return response
+
+    def fork(self) -> "MCP_ChatBot":
+        """A bot for another conversation, sharing this one's servers, tool catalog, adapter, store and metrics"""
+        bot = copy.copy(self)
+        bot.conversation_history = []
+        bot.session_id = None
+        bot.total_input_tokens = 0
+        bot.total_output_tokens = 0
+        bot._prefetched = {}
+        bot._prefetch_remaining = 0
+        bot._turn_call = None
+        bot._revalidate_task = None
+        return bot
+
+    def end_session(self) -> None:
+        """Queue the current conversation's last changes and forget it"""
+        self.save_history()
+        self.llm_adapter.end_conversation(self.session_id)
+        self.conversation_history = []
+        self.session_id = None
+
+    async def resume(self, session_id: str) -> None:
+        """Switch to a stored session, loading its history"""
+        if session_id == self.session_id:
+            return
+        if self.store is None:
+            raise RuntimeError("No conversation store configured")
+        self.save_history()
+        self.llm_adapter.end_conversation(self.session_id)
+        self.conversation_history = await self.store.load(session_id)
+        self.session_id = session_id
+
+    def save_history(self) -> None:
+        """Queue history changes for the store (written in the background)"""
+        if self.store is not None and self.session_id is not None:
+            self.store.record(self.session_id, self.conversation_history)
+
+    async def process_query(self, query, on_tool_result: Optional[ToolResultCallback] = None):
+        """Run one turn; cancelling the task aborts pending LLM and tool calls.
+        
+        on_tool_result(tool_name, tool_args, content) is awaited for each of this turn's tool results.
+        """
+        history_length = len(self.conversation_history)
+        input_tokens, output_tokens = self.total_input_tokens, self.total_output_tokens
+        self._prefetch_remaining = self.prefetch_budget
+        self._turn_call = None
+        if self.recorder:
+            self.recorder.start_turn(query, self.available_tools)
+        cancelled = False
+        try:
+            await self._process_query(query, on_tool_result)
+        except asyncio.CancelledError:
+            cancelled = True
+            # Nobody will read this turn: drop it from the history and count what it cost
+            del self.conversation_history[history_length:]
+            self.metrics['cancelled_turns'] += 1
+            # A deadline ends the turn normally, so only a client cancel counts the call in flight
+            if self._turn_call:
+                self.metrics[f'cancelled_{self._turn_call}_calls'] += 1
+            self.metrics['cancelled_input_tokens'] += self.total_input_tokens - input_tokens
+            self.metrics['cancelled_output_tokens'] += self.total_output_tokens - output_tokens
+            raise
+        finally:
+            self.discard_prefetches()
+            self.save_history()
+            if self.recorder:
+                self.recorder.end_turn(self.total_input_tokens - input_tokens,
+                                       self.total_output_tokens - output_tokens, cancelled)
+
+    def _budget_breach(self, iterations: int, started: float, input_tokens: int, output_tokens: int) -> Optional[str]:
+        """Name of the first turn limit that has been reached, if any"""
+        budget = self.budget
+        if budget.max_tool_iterations is not None and iterations >= budget.max_tool_iterations:
+            return "tool_iterations"
+        if budget.deadline is not None and time.monotonic() - started >= budget.deadline:
+            return "deadline"
+        if budget.max_input_tokens is not None and self.total_input_tokens - input_tokens >= budget.max_input_tokens:
+            return "input_tokens"
+        if budget.max_output_tokens is not None and self.total_output_tokens - output_tokens >= budget.max_output_tokens:
+            return "output_tokens"
+        return None
+
+    def _remaining_time(self, started: float) -> Optional[float]:
+        if self.budget.deadline is None:
+            return None
+        return max(0.0, self.budget.deadline - (time.monotonic() - started))
+
+    def _max_tokens(self, output_tokens: int) -> int:
+        """Cap a completion so it cannot overshoot the turn's output allowance"""
+        if self.budget.max_output_tokens is None:
+            return 2024
+        return max(1, min(2024, self.budget.max_output_tokens - (self.total_output_tokens - output_tokens)))
+
+    async def _run_tool_calls(self, messages: List[ChatMessage], tool_calls,
+                              on_tool_result: Optional[ToolResultCallback] = None) -> None:
+        for tool_call in tool_calls:
+            tool_name = tool_call.function.name
+            tool_args = json.loads(tool_call.function.arguments)
+            tool_id = tool_call.id
+            
+            print(f"Calling tool {tool_name} with args {tool_args}")
+            
+            self._turn_call = "tool"
+            result = await self.call_tool_cached(tool_name, tool_args)
+            self._turn_call = None
+            self.prefetch_follow_ups(tool_name, result)
+            
+            messages.append(ChatMessage(
+                role="tool", 
+                tool_call_id=tool_id,
+                content=str(result.content)
+            ))
+            if on_tool_result:
+                await on_tool_result(tool_name, tool_args, messages[-1].content)
+
+    def _count_breach(self, breach: str) -> None:
+        self.metrics['budget_breaches'] += 1
+        self.metrics[f'budget_breach_{breach}'] += 1
+
+    async def _synthesize(self, messages: List[ChatMessage], tool_calls, reason: str) -> str:
+        """Answer from what the turn gathered, with tools disabled"""
+        print(f"Ending turn early ({reason}), answering without further tools", file=sys.stderr)
+        
+        # Every tool call the model made needs a result, even the ones we never ran
+        answered = {msg.tool_call_id for msg in messages if msg.role == "tool"}
+        for tool_call in tool_calls or []:
+            if tool_call.id not in answered:
+                messages.append(ChatMessage(
+                    role="tool",
+                    tool_call_id=tool_call.id,
+                    content=f"Not run: the turn's {reason.replace('_', ' ')} budget was exhausted."
+                ))
+        
+        try:
+            response = await asyncio.wait_for(
+                self.chat_completion(messages, max_tokens=self.budget.synthesis_max_tokens, tool_choice="none"),
+                self.budget.synthesis_timeout
+            )
+        except asyncio.TimeoutError:
+            response = None
+        if response is None or not response.content:
+            self.metrics['synthesis_failed'] += 1
+            return "⏱️ I couldn't reach an answer for this request. Please try a narrower query."
+        return response.content
+
+    async def _process_query(self, query, on_tool_result: Optional[ToolResultCallback] = None):
+        # Add user message to conversation history
+        self.conversation_history.append(ChatMessage(role='user', content=query))
+        
+        # Turn budget: tool rounds so far, start time and token totals at the start
+        started = time.monotonic()
+        input_tokens, output_tokens = self.total_input_tokens, self.total_output_tokens
+        iterations = 0
+        # Why the turn needs a tool-free final answer: a TurnBudget limit or an empty response
+        breach = None
+        # Tool calls of the assistant message being executed, if any
+        pending_calls = None
+        
+        # Use full conversation history for context
+        messages = self.conversation_history.copy()
         
         assistant_response_content = None
-        process_query = True
-        while process_query:
+        try:
+            response = await asyncio.wait_for(
+                self.chat_completion(messages, max_tokens=self._max_tokens(output_tokens)),
+                self._remaining_time(started)
+            )
             
-            if response.content:
-                print(response.content)
-                assistant_response_content = response.content
+            while True:
+                
+                if response.content:
+                    print(response.content)
+                    assistant_response_content = response.content
+                
+                # No tool calls ends the turn whatever the content; an empty answer gets synthesized
                 if not response.tool_calls:
-                    process_query = False
-            
-            if response.tool_calls:
+                    if not response.content:
+                        # Ordinary model behaviour, not a budget breach
+                        self.metrics['empty_responses'] += 1
+                        breach = "empty_response"
+                    break
+                
+                breach = self._budget_breach(iterations, started, input_tokens, output_tokens)
+                if breach:
+                    self._count_breach(breach)
+                    break
+                iterations += 1
+                
                 messages.append(ChatMessage(
                     role='assistant',
                     content=response.content,
                     tool_calls=response.tool_calls
                 ))
+                pending_calls = response.tool_calls
                 
-                for tool_call in response.tool_calls:
-                    tool_name = tool_call.function.name
-                    tool_args = json.loads(tool_call.function.arguments)
-                    tool_id = tool_call.id
-                    
-                    print(f"Calling tool {tool_name} with args {tool_args}")
-                    
-                    # Get the session for this specific tool
-                    session = self.tool_to_session[tool_name]
-                    result = await session.call_tool(tool_name, arguments=tool_args)
-                    
-                    messages.append(ChatMessage(
-                        role="tool", 
-                        tool_call_id=tool_id,
-                        content=str(result.content)
-                    ))
-                
-                response = await self.llm_adapter.chat_completion(
-                    messages=messages,
-                    tools=self.available_tools,
-                    max_tokens=2024
+                await asyncio.wait_for(
+                    self._run_tool_calls(messages, response.tool_calls, on_tool_result),
+                    self._remaining_time(started)
                 )
+                pending_calls = None
                 
-                # Track token usage for follow-up calls
-                if response.usage:
-                    self.print_token_usage(response.usage.get('prompt_tokens', 0), response.usage.get('completion_tokens', 0))
-                
-                if response.content and not response.tool_calls:
-                    assistant_response_content = response.content
-                    print(response.content)
-                    process_query = False
+                response = await asyncio.wait_for(
+                    self.chat_completion(messages, max_tokens=self._max_tokens(output_tokens)),
+                    self._remaining_time(started)
+                )
+        except asyncio.TimeoutError:
+            # wait_for cancelled the call in flight (tools get a cancellation notice)
+            breach = "deadline"
+            self._count_breach(breach)
+        
+        if breach:
+            assistant_response_content = await self._synthesize(messages, pending_calls, breach)
+            print(assistant_response_content)
         
         # Add assistant response to conversation history
         if assistant_response_content:
@@ -202,6 +613,7 @@ class MCP_ChatBot:
                     break
                 elif query.lower() == 'clear':
                     self.conversation_history = []
+                    self.save_history()
                     self.total_input_tokens = 0
                     self.total_output_tokens = 0
                     print("🧹 Conversation history and token counts cleared!")
@@ -209,22 +621,40 @@ class MCP_ChatBot:
                 elif query.lower() == 'history':
                     print(f"\n📜 Conversation History ({len(self.conversation_history)} messages):")
                     for i, msg in enumerate(self.conversation_history):
-                        role_emoji = "🧑" if msg['role'] == 'user' else "🤖"
-                        print(f"  {i+1}. {role_emoji} {msg['role']}: {msg['content'][:100]}{'...' if len(msg['content']) > 100 else ''}")
+                        role_emoji = "🧑" if msg.role == 'user' else "🤖"
+                        content = msg.content or ""
+                        print(f"  {i+1}. {role_emoji} {msg.role}: {content[:100]}{'...' if len(content) > 100 else ''}")
                     continue
                     
                 await self.process_query(query)
+                # input() blocks the loop, so write the turn now rather than on a timer
+                if self.store is not None:
+                    await self.store.flush()
                     
             except Exception as e:
                 print(f"\n❌ Error: {str(e)}")
     
     async def cleanup(self):
-        """Cleanly close all resources using AsyncExitStack."""
-        await self.exit_stack.aclose()
+        """Close every server connection from the task that opened it."""
+        if self._revalidate_task:
+            self._revalidate_task.cancel()
+        self._shutdown.set()
+        await asyncio.gather(*self._server_tasks.values(), return_exceptions=True)
+        if self.store is not None:
+            await self.store.close()
 
 async def main():
-    chatbot = MCP_ChatBot()
+    # --session <id> keeps the conversation in sessions/ and resumes it on restart
+    session_id = sys.argv[sys.argv.index("--session") + 1] if "--session" in sys.argv else None
+    # --record <path> writes every turn's LLM and tool traffic to a cassette (see cassette.py)
+    record_path = sys.argv[sys.argv.index("--record") + 1] if "--record" in sys.argv else None
+    chatbot = MCP_ChatBot(store=ConversationStore() if session_id else None)
+    if record_path:
+        chatbot.recorder = CassetteRecorder(record_path, chatbot.llm_adapter.provider_name, chatbot.llm_adapter.model)
     try:
+        if session_id:
+            await chatbot.resume(session_id)
+            print(f"📂 Session '{session_id}': {len(chatbot.conversation_history)} messages restored")
         await chatbot.connect_to_servers()
         await chatbot.chat_loop()
     finally:
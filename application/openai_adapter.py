@@ -1,7 +1,6 @@
-import openai
 import os
 from typing import List, Dict, Any, Optional
-from llm_adapter import LLMAdapter, ChatMessage, ChatResponse, CacheControl
+from llm_adapter import LLMAdapter, ChatMessage, ChatResponse, CacheControl, MessageBuffer
 
 
 class OpenAIAdapter(LLMAdapter):
@@ -14,11 +13,46 @@ class OpenAIAdapter(LLMAdapter):
         
         super().__init__(model, enable_caching=enable_caching, cache_system_messages=cache_system_messages)
         
-        self.client = openai.OpenAI(
+        self._client_args = dict(
             api_key=api_key or os.getenv("OPENAI_API_KEY"),
             base_url=base_url,
             **kwargs  # Now only contains OpenAI-compatible parameters
         )
+        self._client = None
+        # Serialized message buffers, one per conversation
+        self._buffers: Dict[Optional[str], MessageBuffer] = {}
+    
+    @property
+    def client(self):
+        """OpenAI client, created (and the SDK imported) on first request"""
+        if self._client is None:
+            import openai
+            # Async client so a cancelled turn also aborts the in-flight HTTP request
+            self._client = openai.AsyncOpenAI(**self._client_args)
+        return self._client
+    
+    def _to_openai_message(self, msg: ChatMessage) -> Dict[str, Any]:
+        """Convert a ChatMessage to the OpenAI wire format"""
+        msg = self.add_cache_breakpoint(msg)
+        openai_msg = {"role": msg.role}
+        
+        # Handle content with cache_control for Anthropic/Gemini
+        if msg.content and msg.cache_control and self.requires_manual_cache_control:
+            openai_msg["content"] = [
+                {
+                    "type": "text",
+                    "text": msg.content,
+                    "cache_control": {"type": msg.cache_control.type}
+                }
+            ]
+        elif msg.content:
+            openai_msg["content"] = msg.content
+            
+        if msg.tool_calls:
+            openai_msg["tool_calls"] = msg.tool_calls
+        if msg.tool_call_id:
+            openai_msg["tool_call_id"] = msg.tool_call_id
+        return openai_msg
     
     async def chat_completion(
         self, 
@@ -28,36 +62,14 @@ class OpenAIAdapter(LLMAdapter):
         temperature: float = 0.7,
         **kwargs
     ) -> ChatResponse:
-        # Apply caching to messages if enabled
-        processed_messages = []
-        for msg in messages:
-            cached_msg = self.add_cache_breakpoint(msg)
-            processed_messages.append(cached_msg)
-        
-        # Convert our ChatMessage format to OpenAI format
-        openai_messages = []
-        for msg in processed_messages:
-            openai_msg = {"role": msg.role}
-            
-            # Handle content with cache_control for Anthropic/Gemini
-            if msg.content and msg.cache_control and self.requires_manual_cache_control:
-                openai_msg["content"] = [
-                    {
-                        "type": "text",
-                        "text": msg.content,
-                        "cache_control": {"type": msg.cache_control.type}
-                    }
-                ]
-            elif msg.content:
-                openai_msg["content"] = msg.content
-                
-            if msg.tool_calls:
-                openai_msg["tool_calls"] = msg.tool_calls
-            if msg.tool_call_id:
-                openai_msg["tool_call_id"] = msg.tool_call_id
-            openai_messages.append(openai_msg)
+        # Only messages appended since the last call need converting
+        conversation_id = kwargs.pop('conversation_id', None)
+        buffer = self._buffers.get(conversation_id)
+        if buffer is None:
+            buffer = self._buffers[conversation_id] = MessageBuffer()
+        openai_messages = buffer.sync(messages, self._to_openai_message)
         
-        response = self.client.chat.completions.create(
+        response = await self.client.chat.completions.create(
             model=self.model,
             messages=openai_messages,
             tools=tools,
@@ -73,6 +85,9 @@ class OpenAIAdapter(LLMAdapter):
             usage=response.usage.model_dump() if response.usage else None
         )
     
+    def end_conversation(self, conversation_id: Optional[str]) -> None:
+        self._buffers.pop(conversation_id, None)
+    
     def get_available_models(self) -> List[str]:
         # This would ideally fetch from the API, but for now return common models
         return [
@@ -0,0 +1,83 @@
+"""Import-time benchmark for the startup path.
+
+Imports each entry module in a fresh interpreter, reports the best wall
+time over a few runs, and fails if a heavy dependency got pulled onto the
+startup path or an import exceeds its budget. The third-party packages an
+entry point always needs (the MCP SDK and its pydantic stack) are imported
+first and timed separately, so budgets cover only this repo's own import
+work and do not swing with the machine's speed at loading those.
+
+    uv run python benchmarks/import_time.py [--runs 5] [--budget-scale 1.0]
+"""
+import argparse
+import json
+import os
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Modules that must only be imported on first use
+HEAVY_MODULES = ["openai", "arxiv", "numpy", "pypdf"]
+
+# (label, directory added to sys.path, module, baseline imports, budget in ms over the baseline)
+ENTRY_POINTS = [
+    ("llm_factory", "application", "llm_factory", [], 50),
+    ("multi_server_chatbot", "application", "multi_server_chatbot", ["dotenv", "mcp", "mcp.client.stdio"], 150),
+    ("arxiv_server", "servers", "arxiv_server", ["mcp.server.fastmcp"], 200),
+]
+
+PROBE = """
+import importlib, json, sys, time
+sys.path.insert(0, {path!r})
+start = time.perf_counter()
+for name in {baseline!r}:
+    importlib.import_module(name)
+baseline = time.perf_counter() - start
+start = time.perf_counter()
+import {module}
+elapsed = time.perf_counter() - start
+print(json.dumps({{"ms": elapsed * 1000, "baseline_ms": baseline * 1000,
+                  "heavy": [m for m in {heavy!r} if m in sys.modules]}}))
+"""
+
+
+def measure(path: str, module: str, baseline: list, runs: int) -> dict:
+    best, best_baseline, heavy = None, None, []
+    for _ in range(runs):
+        code = PROBE.format(path=os.path.join(ROOT, path), module=module, baseline=baseline, heavy=HEAVY_MODULES)
+        output = subprocess.run(
+            [sys.executable, "-c", code], cwd=ROOT, capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        result = json.loads(output)
+        best = result["ms"] if best is None else min(best, result["ms"])
+        best_baseline = result["baseline_ms"] if best_baseline is None else min(best_baseline, result["baseline_ms"])
+        heavy = result["heavy"]
+    return {"ms": best, "baseline_ms": best_baseline, "heavy": heavy}
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=5, help="fresh interpreters per module")
+    parser.add_argument("--budget-scale", type=float, default=1.0, help="multiply budgets (slow machines/CI)")
+    args = parser.parse_args()
+
+    failed = False
+    print(f"{'entry point':<22} {'own':>10}  {'baseline':>10}")
+    for label, path, module, baseline, budget in ENTRY_POINTS:
+        result = measure(path, module, baseline, args.runs)
+        limit = budget * args.budget_scale
+        problems = []
+        if result["heavy"]:
+            problems.append(f"imports {', '.join(result['heavy'])} eagerly")
+        if result["ms"] > limit:
+            problems.append(f"over budget ({limit:.0f}ms)")
+        status = "FAIL " + "; ".join(problems) if problems else "ok"
+        print(f"{label:<22} {result['ms']:8.1f}ms  {result['baseline_ms']:8.1f}ms  {status}")
+        failed = failed or bool(problems)
+
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
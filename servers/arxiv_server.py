@@ -1,28 +1,119 @@
-import arxiv
+import asyncio
+import importlib
 import json
 import os
 import sys
-from typing import List
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
 from mcp.server.fastmcp import FastMCP
 
+from paper_index import PaperIndex, canonical_topic
+from paper_text import PaperTextStore, PdfPipeline, LocalFileFetcher
+from paper_vectors import PaperVectorIndex
+
 
 PAPER_DIR = "papers"
 
+# Seconds a fetched topic is answered from the store before arXiv is asked again
+TOPIC_CACHE_TTL = float(os.getenv("TOPIC_CACHE_TTL", 24 * 3600))
+
+# Optional "module:function" sentence embedder for topics. Near-duplicate topics
+# reuse earlier papers only with one: the built-in hashing embedder scores
+# "deep reinforcement learning" as a duplicate of "reinforcement learning"
+# but not "language model agents" of "LLM agents".
+TOPIC_EMBEDDER = os.getenv("TOPIC_EMBEDDER")
+TOPIC_EMBEDDER_DIM = int(os.getenv("TOPIC_EMBEDDER_DIM", 512))
+
+# Cosine similarity above which a new topic reuses an earlier topic's papers
+TOPIC_DEDUPE_THRESHOLD = float(os.getenv("TOPIC_DEDUPE_THRESHOLD", 0.85))
+
+# Per-tool timeouts in seconds: arXiv round trips vs. local store/index work
+TOOL_TIMEOUTS = {
+    'arxiv': float(os.getenv("ARXIV_TOOL_TIMEOUT", 60)),
+    'local': float(os.getenv("LOCAL_TOOL_TIMEOUT", 15)),
+}
+
+# Blocking work runs off the event loop so one slow search doesn't stall other requests
+NETWORK_POOL = ThreadPoolExecutor(max_workers=4, thread_name_prefix="arxiv")
+DISK_POOL = ThreadPoolExecutor(max_workers=8, thread_name_prefix="store")
+
 # Initialize FastMCP server
 mcp = FastMCP("research")
 
-@mcp.tool()
-def search_papers(topic: str, max_results: int = 5) -> List[str]:
-    """
-    Search for papers on arXiv based on a topic and store their information.
-    
-    Args:
-        topic: The topic to search for
-        max_results: Maximum number of results to retrieve (default: 5)
-        
-    Returns:
-        List of paper IDs found in the search
-    """
+# Canonical paper records, topic membership and full-text index
+paper_index = PaperIndex(os.path.join(PAPER_DIR, "index.sqlite"))
+
+# Background PDF download/extraction; PDF_FIXTURE_DIR swaps arXiv for local files
+text_store = PaperTextStore(os.path.join(PAPER_DIR, "texts"))
+pdf_pipeline = PdfPipeline(
+    text_store,
+    fetcher=LocalFileFetcher(os.environ["PDF_FIXTURE_DIR"]) if os.getenv("PDF_FIXTURE_DIR") else None
+)
+
+
+def _topic_embedder(texts):
+    # Resolved on first use so spawning the server doesn't import the model
+    module_name, _, name = TOPIC_EMBEDDER.partition(":")
+    return getattr(importlib.import_module(module_name), name)(texts)
+
+
+# Embedding indexes over paper summaries and, with TOPIC_EMBEDDER, previously searched topics
+paper_vectors = PaperVectorIndex(os.path.join(PAPER_DIR, "vectors", "papers"))
+topic_vectors = PaperVectorIndex(
+    os.path.join(PAPER_DIR, "vectors", f"topics-{canonical_topic(TOPIC_EMBEDDER)}"),
+    embedder=_topic_embedder,
+    dim=TOPIC_EMBEDDER_DIM
+) if TOPIC_EMBEDDER else None
+
+
+_legacy_imported = False
+_legacy_lock = threading.Lock()
+
+def _import_legacy_topics() -> None:
+    """Fold old per-topic papers_info.json directories into the store, once per process"""
+    global _legacy_imported
+    if _legacy_imported:
+        return
+    # DISK_POOL threads can arrive together; only the first imports, the rest wait for it
+    with _legacy_lock:
+        if not _legacy_imported:
+            paper_index.sync_directory(PAPER_DIR)
+            _legacy_imported = True
+
+
+def _similar_topic_papers(topic: str, max_results: int) -> Optional[List[str]]:
+    """Ids from the latest fetch of the same (or, with TOPIC_EMBEDDER, a near-duplicate) topic, if recent and large enough"""
+    fetch = paper_index.topic_fetch(topic)
+    if fetch is None and topic_vectors is not None:
+        try:
+            matches = topic_vectors.search(topic, k=1)
+        except RuntimeError:
+            matches = []
+        if matches and matches[0][1] >= TOPIC_DEDUPE_THRESHOLD:
+            fetch = paper_index.topic_fetch(matches[0][0])
+    if fetch is None:
+        return None
+
+    fetched, paper_ids = fetch
+    if time.time() - fetched > TOPIC_CACHE_TTL or len(paper_ids) < max_results:
+        return None
+    return paper_ids[:max_results]
+
+
+def _sync_paper_vectors() -> None:
+    """Embed any stored paper that has no vector yet"""
+    missing = set(paper_index.ids()).difference(paper_vectors.keys())
+    if missing:
+        papers = paper_index.get(list(missing))
+        paper_vectors.add([(paper_id, f"{info['title']}\n{info['summary']}") for paper_id, info in papers.items()])
+
+
+def _fetch_arxiv(topic: str, max_results: int) -> Dict[str, dict]:
+    """Query arXiv and return paper records keyed by short id"""
+    # Imported here so spawning the server doesn't pay for it
+    import arxiv
     
     # Search for the most relevant articles matching the queried topic
     search = arxiv.Search(
@@ -37,46 +128,166 @@ def search_papers(topic: str, max_results: int = 5) -> List[str]:
         delay_seconds=1,  # Reduced from default 3 seconds
         num_retries=2     # Reduced from default 3 retries
     )
-    papers = list(client.results(search))
-    
-    # Create directory for this topic
-    path = os.path.join(PAPER_DIR, topic.lower().replace(" ", "_"))
-    os.makedirs(path, exist_ok=True)
     
-    file_path = os.path.join(path, "papers_info.json")
-
-    # Try to load existing papers info
-    try:
-        with open(file_path, "r") as json_file:
-            papers_info = json.load(json_file)
-    except (FileNotFoundError, json.JSONDecodeError):
-        papers_info = {}
-
-    # Process each paper and add to papers_info  
-    paper_ids = []
-    for paper in papers:
-        paper_ids.append(paper.get_short_id())
-        paper_info = {
+    # One record per paper id, shared by every topic that finds it
+    papers_info = {}
+    for paper in client.results(search):
+        papers_info[paper.get_short_id()] = {
             'title': paper.title,
             'authors': [author.name for author in paper.authors],
             'summary': paper.summary,
             'pdf_url': paper.pdf_url,
             'published': str(paper.published.date())
         }
-        papers_info[paper.get_short_id()] = paper_info
+    return papers_info
+
+
+def _save_papers(topic: str, papers_info: Dict[str, dict]) -> None:
+    """Store fetched papers, index them and queue their PDFs"""
+    paper_index.add_papers(papers_info, topic=topic)
+    try:
+        if topic_vectors is not None:
+            topic_vectors.add([(canonical_topic(topic), topic)])
+        paper_vectors.add([(paper_id, f"{info['title']}\n{info['summary']}") for paper_id, info in papers_info.items()])
+    except RuntimeError as e:
+        print(f"Skipping vector index update: {e}", file=sys.stderr)
+    
+    # Fetch full text in the background so later questions don't block on a PDF download
+    for paper_id, info in papers_info.items():
+        pdf_pipeline.submit(paper_id, info['pdf_url'])
+    
+    print(f"Saved {len(papers_info)} papers under topic '{canonical_topic(topic)}'", file=sys.stderr)
+
+
+def _cached_topic_papers(topic: str, max_results: int) -> Optional[List[str]]:
+    _import_legacy_topics()
+    return _similar_topic_papers(topic, max_results)
+
+
+def _extract_info(paper_id: str) -> str:
+    _import_legacy_topics()
     
-    # Save updated papers_info to json file
-    with open(file_path, "w") as json_file:
-        json.dump(papers_info, json_file, indent=2)
+    papers = paper_index.get([paper_id])
+    if paper_id in papers:
+        return json.dumps(papers[paper_id], indent=2)
     
-    print(f"Results are saved in: {file_path}")
+    return f"There's no saved information related to paper {paper_id}."
+
+
+def _search_local_papers(query: str, author: Optional[str], published_after: Optional[str],
+                         published_before: Optional[str], max_results: int) -> str:
+    _import_legacy_topics()
     
-    return paper_ids
+    results = paper_index.search(
+        query,
+        author=author,
+        published_after=published_after,
+        published_before=published_before,
+        limit=max_results
+    )
+    if not results:
+        return f"No saved papers match '{query}'. Try search_papers to fetch from arXiv."
+    return json.dumps(results, indent=2)
+
+
+def _find_similar_papers(query: str, max_results: int) -> str:
+    _import_legacy_topics()
+    try:
+        _sync_paper_vectors()
+        if query in paper_vectors:
+            matches = paper_vectors.search(key=query, k=max_results)
+        else:
+            matches = paper_vectors.search(query, k=max_results)
+    except RuntimeError as e:
+        return str(e)
+    
+    if not matches:
+        return "No saved papers to compare against. Search for papers first."
+    papers = paper_index.get([paper_id for paper_id, _ in matches])
+    return json.dumps([{
+        "id": paper_id,
+        "title": papers.get(paper_id, {}).get("title"),
+        "published": papers.get(paper_id, {}).get("published"),
+        "score": round(score, 4)
+    } for paper_id, score in matches], indent=2)
+
+
+def _get_paper_text(paper_id: str, section: Optional[str], offset: int, length: int) -> str:
+    if offset < 0 or length <= 0:
+        return f"Invalid range: offset must be 0 or more and length greater than 0 (got offset={offset}, length={length})."
+    index = text_store.load_index(paper_id)
+    if index is None:
+        if pdf_pipeline.is_pending(paper_id):
+            return f"The text of paper {paper_id} is still being downloaded. Try again shortly."
+        if paper_id in pdf_pipeline.failures:
+            return f"Could not extract the text of paper {paper_id}: {pdf_pipeline.failures[paper_id]}"
+        _import_legacy_topics()
+        papers = paper_index.get([paper_id])
+        if paper_id not in papers:
+            return f"There's no saved information related to paper {paper_id}."
+        if not pdf_pipeline.submit(paper_id, papers[paper_id]['pdf_url']) and not pdf_pipeline.is_pending(paper_id):
+            return f"The text of paper {paper_id} can't be downloaded right now (no PDF link or download queue full)."
+        return f"The text of paper {paper_id} has been queued for download. Try again shortly."
+    
+    start, end = 0, index['length']
+    if section:
+        sections = index['sections']
+        for i, (heading, position) in enumerate(sections):
+            if section.lower() in heading.lower():
+                start = position
+                end = sections[i + 1][1] if i + 1 < len(sections) else index['length']
+                break
+        else:
+            headings = ", ".join(heading for heading, _ in sections) or "none detected"
+            return f"Section '{section}' not found in paper {paper_id}. Sections: {headings}"
+    
+    if offset >= end - start:
+        where = f"section '{heading}'" if section else "the paper"
+        return f"Offset {offset} is past the end of {where} ({end - start} characters)."
+    start += offset
+    text = text_store.read(paper_id, start, min(length, end - start))
+    remaining = end - start - len(text)
+    if remaining > 0:
+        text += f"\n\n[... {remaining} more characters, continue with offset={offset + len(text)}]"
+    return text
+
+
+async def _offload(pool: ThreadPoolExecutor, timeout: float, func, *args):
+    """Run blocking work on pool; give up after timeout (the thread finishes in the background)"""
+    loop = asyncio.get_running_loop()
+    try:
+        return await asyncio.wait_for(loop.run_in_executor(pool, func, *args), timeout)
+    except asyncio.TimeoutError:
+        raise TimeoutError(f"{func.__name__.lstrip('_')} timed out after {timeout:g}s")
+
+
+@mcp.tool()
+async def search_papers(topic: str, max_results: int = 5, refresh: bool = False) -> List[str]:
+    """
+    Search for papers on arXiv based on a topic and store their information.
+    
+    Args:
+        topic: The topic to search for
+        max_results: Maximum number of results to retrieve (default: 5)
+        refresh: Query arXiv even if this topic was searched recently (default: False)
+        
+    Returns:
+        List of paper IDs found in the search, most relevant first
+    """
+    # A topic fetched within TOPIC_CACHE_TTL is answered locally
+    if not refresh:
+        cached_ids = await _offload(DISK_POOL, TOOL_TIMEOUTS['local'], _cached_topic_papers, topic, max_results)
+        if cached_ids:
+            return cached_ids
+    
+    papers_info = await _offload(NETWORK_POOL, TOOL_TIMEOUTS['arxiv'], _fetch_arxiv, topic, max_results)
+    await _offload(DISK_POOL, TOOL_TIMEOUTS['local'], _save_papers, topic, papers_info)
+    return list(papers_info)
 
 @mcp.tool()
-def extract_info(paper_id: str) -> str:
+async def extract_info(paper_id: str) -> str:
     """
-    Search for information about a specific paper across all topic directories.
+    Look up the saved information about a specific paper.
     
     Args:
         paper_id: The ID of the paper to look for
@@ -84,26 +295,63 @@ def extract_info(paper_id: str) -> str:
     Returns:
         JSON string with paper information if found, error message if not found
     """
-    # Check if papers directory exists
-    if not os.path.exists(PAPER_DIR):
-        return f"No papers directory found. Search for papers first."
- 
-    for item in os.listdir(PAPER_DIR):
-        item_path = os.path.join(PAPER_DIR, item)
-        if os.path.isdir(item_path):
-            file_path = os.path.join(item_path, "papers_info.json")
-            if os.path.isfile(file_path):
-                try:
-                    with open(file_path, "r") as json_file:
-                        papers_info = json.load(json_file)
-                        if paper_id in papers_info:
-                            return json.dumps(papers_info[paper_id], indent=2)
-                except (FileNotFoundError, json.JSONDecodeError) as e:
-                    print(f"Error reading {file_path}: {str(e)}")
-                    continue
+    return await _offload(DISK_POOL, TOOL_TIMEOUTS['local'], _extract_info, paper_id)
+
+@mcp.tool()
+async def search_local_papers(
+    query: str,
+    author: Optional[str] = None,
+    published_after: Optional[str] = None,
+    published_before: Optional[str] = None,
+    max_results: int = 10
+) -> str:
+    """
+    Search papers already saved locally by title, summary and authors, without calling arXiv.
     
-    return f"There's no saved information related to paper {paper_id}."
+    Args:
+        query: Free-text query matched against titles, summaries and authors
+        author: Only return papers with an author name containing this text
+        published_after: Only return papers published on or after this date (YYYY-MM-DD)
+        published_before: Only return papers published on or before this date (YYYY-MM-DD)
+        max_results: Maximum number of results to return (default: 10)
+        
+    Returns:
+        JSON string with ranked matching papers, best match first
+    """
+    return await _offload(
+        DISK_POOL, TOOL_TIMEOUTS['local'], _search_local_papers,
+        query, author, published_after, published_before, max_results
+    )
 
+@mcp.tool()
+async def find_similar_papers(query: str, max_results: int = 5) -> str:
+    """
+    Find saved papers semantically similar to a text query or to another saved paper.
+    
+    Args:
+        query: Free text, or the ID of a saved paper to find neighbours of
+        max_results: Maximum number of results to return (default: 5)
+        
+    Returns:
+        JSON string with the most similar papers and their cosine similarity
+    """
+    return await _offload(DISK_POOL, TOOL_TIMEOUTS['local'], _find_similar_papers, query, max_results)
+
+@mcp.tool()
+async def get_paper_text(paper_id: str, section: Optional[str] = None, offset: int = 0, length: int = 4000) -> str:
+    """
+    Read the full text of a saved paper, downloaded in the background after search_papers.
+    
+    Args:
+        paper_id: The ID of the paper to read
+        section: Optional section heading to start from (e.g. "Introduction", "Results")
+        offset: Character offset to start reading from (relative to the section if given)
+        length: Maximum number of characters to return (default: 4000)
+        
+    Returns:
+        The requested slice of the paper text, or a status message if it is not available yet
+    """
+    return await _offload(DISK_POOL, TOOL_TIMEOUTS['local'], _get_paper_text, paper_id, section, offset, length)
 
 
 if __name__ == "__main__":
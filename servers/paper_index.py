@@ -0,0 +1,241 @@
+import json
+import os
+import re
+import sqlite3
+import sys
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+
+SCHEMA = """
+PRAGMA journal_mode = WAL;
+CREATE TABLE IF NOT EXISTS papers (
+    id TEXT PRIMARY KEY,
+    title TEXT,
+    authors TEXT,
+    summary TEXT,
+    pdf_url TEXT,
+    published TEXT
+);
+CREATE INDEX IF NOT EXISTS papers_published ON papers(published);
+CREATE VIRTUAL TABLE IF NOT EXISTS papers_fts USING fts5(
+    paper_id UNINDEXED, title, summary, authors,
+    tokenize = 'porter unicode61'
+);
+CREATE TABLE IF NOT EXISTS topic_papers (
+    topic TEXT,
+    paper_id TEXT,
+    PRIMARY KEY (topic, paper_id)
+);
+CREATE TABLE IF NOT EXISTS topic_fetches (
+    topic TEXT PRIMARY KEY,
+    fetched REAL,
+    paper_ids TEXT
+);
+CREATE TABLE IF NOT EXISTS sources (
+    path TEXT PRIMARY KEY,
+    mtime REAL
+);
+"""
+
+STOP_WORDS = {"a", "an", "the", "of", "for", "in", "on", "and", "to", "with"}
+
+
+def _stem(word: str) -> str:
+    """Light plural stripping so "networks"/"network" share a key"""
+    if len(word) > 4 and word.endswith("ies"):
+        return word[:-3] + "y"
+    if len(word) > 4 and word.endswith(("sses", "xes", "ches", "shes")):
+        return word[:-2]
+    if len(word) > 3 and word.endswith("s") and not word.endswith(("ss", "us", "is")):
+        return word[:-1]
+    return word
+
+
+def canonical_topic(topic: str) -> str:
+    """Slug a topic so "Machine Learning", "machine-learning" and "machine_learnings" collide"""
+    words = [_stem(word) for word in re.findall(r"[a-z0-9]+", topic.lower()) if word not in STOP_WORDS]
+    return "_".join(words) or "untitled"
+
+# BM25 column weights: paper_id, title, summary, authors
+BM25_WEIGHTS = (0.0, 10.0, 1.0, 5.0)
+
+
+class PaperIndex:
+    """SQLite store of saved papers: one row per paper id, topic membership, and an FTS5 index"""
+
+    def __init__(self, db_path: str):
+        self.db_path = db_path
+        self._initialized = False
+        self._init_lock = threading.Lock()
+
+    def _connect(self) -> sqlite3.Connection:
+        # Tools run on a thread pool; WAL lets readers proceed while one thread writes
+        if not self._initialized:
+            with self._init_lock:
+                if not self._initialized:
+                    os.makedirs(os.path.dirname(self.db_path) or ".", exist_ok=True)
+                    conn = sqlite3.connect(self.db_path, timeout=10)
+                    conn.executescript(SCHEMA)
+                    conn.close()
+                    self._initialized = True
+        return sqlite3.connect(self.db_path, timeout=10)
+
+    def add_papers(self, papers_info: Dict[str, dict], topic: Optional[str] = None) -> None:
+        """Insert or update papers, recording them under the canonical form of topic as its latest fetch"""
+        with self._connect() as conn:
+            self._upsert(conn, papers_info, topic, fetched=time.time())
+        conn.close()
+
+    def _upsert(self, conn: sqlite3.Connection, papers_info: Dict[str, dict],
+                topic: Optional[str] = None, fetched: Optional[float] = None) -> None:
+        if topic is not None:
+            key = canonical_topic(topic)
+            conn.executemany(
+                "INSERT OR IGNORE INTO topic_papers(topic, paper_id) VALUES (?, ?)",
+                [(key, paper_id) for paper_id in papers_info]
+            )
+            # papers_info is in arXiv's relevance order
+            conn.execute(
+                "INSERT OR REPLACE INTO topic_fetches(topic, fetched, paper_ids) VALUES (?, ?, ?)",
+                (key, fetched, json.dumps(list(papers_info)))
+            )
+        for paper_id, info in papers_info.items():
+            authors = ", ".join(info.get("authors", []))
+            conn.execute("DELETE FROM papers_fts WHERE paper_id = ?", (paper_id,))
+            conn.execute(
+                "INSERT OR REPLACE INTO papers(id, title, authors, summary, pdf_url, published) "
+                "VALUES (?, ?, ?, ?, ?, ?)",
+                (paper_id, info.get("title"), authors, info.get("summary"),
+                 info.get("pdf_url"), info.get("published"))
+            )
+            conn.execute(
+                "INSERT INTO papers_fts(paper_id, title, summary, authors) VALUES (?, ?, ?, ?)",
+                (paper_id, info.get("title", ""), info.get("summary", ""), authors)
+            )
+
+    def sync_directory(self, paper_dir: str) -> int:
+        """Import legacy <topic>/papers_info.json files changed since the last sync"""
+        if not os.path.isdir(paper_dir):
+            return 0
+
+        updated = 0
+        with self._connect() as conn:
+            known = dict(conn.execute("SELECT path, mtime FROM sources"))
+            for item in os.listdir(paper_dir):
+                file_path = os.path.join(paper_dir, item, "papers_info.json")
+                if not os.path.isfile(file_path):
+                    continue
+                mtime = os.path.getmtime(file_path)
+                if known.get(file_path) == mtime:
+                    continue
+                try:
+                    with open(file_path, "r") as json_file:
+                        papers_info = json.load(json_file)
+                except (FileNotFoundError, json.JSONDecodeError) as e:
+                    print(f"Error reading {file_path}: {str(e)}", file=sys.stderr)
+                    continue
+                # The file's age stands in for when its topic was fetched
+                self._upsert(conn, papers_info, topic=item, fetched=mtime)
+                conn.execute(
+                    "INSERT OR REPLACE INTO sources(path, mtime) VALUES (?, ?)",
+                    (file_path, mtime)
+                )
+                updated += 1
+        conn.close()
+        return updated
+
+    def get(self, paper_ids: List[str]) -> Dict[str, dict]:
+        """Stored metadata for the given ids (missing ids are left out)"""
+        if not paper_ids:
+            return {}
+        placeholders = ", ".join("?" * len(paper_ids))
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT id, title, authors, summary, pdf_url, published "
+                f"FROM papers WHERE id IN ({placeholders})",
+                list(paper_ids)
+            ).fetchall()
+        conn.close()
+        return {paper_id: {
+            "title": title,
+            "authors": authors.split(", ") if authors else [],
+            "summary": summary,
+            "pdf_url": pdf_url,
+            "published": published
+        } for paper_id, title, authors, summary, pdf_url, published in rows}
+
+    def topic_papers(self, topic: str) -> List[str]:
+        """Ids saved under the canonical form of topic, oldest first"""
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT paper_id FROM topic_papers WHERE topic = ? ORDER BY rowid",
+                (canonical_topic(topic),)
+            ).fetchall()
+        conn.close()
+        return [paper_id for (paper_id,) in rows]
+
+    def topic_fetch(self, topic: str) -> Optional[Tuple[float, List[str]]]:
+        """When the canonical form of topic was last fetched, and that fetch's ids in relevance order"""
+        with self._connect() as conn:
+            row = conn.execute(
+                "SELECT fetched, paper_ids FROM topic_fetches WHERE topic = ?",
+                (canonical_topic(topic),)
+            ).fetchone()
+        conn.close()
+        return (row[0], json.loads(row[1])) if row else None
+
+    def ids(self) -> List[str]:
+        """All indexed paper ids"""
+        with self._connect() as conn:
+            rows = conn.execute("SELECT id FROM papers").fetchall()
+        conn.close()
+        return [paper_id for (paper_id,) in rows]
+
+    def search(
+        self,
+        query: str,
+        author: Optional[str] = None,
+        published_after: Optional[str] = None,
+        published_before: Optional[str] = None,
+        limit: int = 10
+    ) -> List[dict]:
+        """Rank stored papers against query with BM25, applying optional filters"""
+        terms = re.findall(r"\w+", query.lower())
+        if not terms:
+            return []
+        match = " OR ".join(f'"{term}"' for term in terms)
+
+        sql = (
+            "SELECT p.id, p.title, p.authors, p.published, p.pdf_url, "
+            f"bm25(papers_fts, {', '.join(map(str, BM25_WEIGHTS))}) AS score "
+            "FROM papers_fts JOIN papers p ON p.id = papers_fts.paper_id "
+            "WHERE papers_fts MATCH ?"
+        )
+        params: list = [match]
+        if author:
+            sql += " AND p.authors LIKE ?"
+            params.append(f"%{author}%")
+        if published_after:
+            sql += " AND p.published >= ?"
+            params.append(published_after)
+        if published_before:
+            sql += " AND p.published <= ?"
+            params.append(published_before)
+        sql += " ORDER BY score LIMIT ?"
+        params.append(limit)
+
+        with self._connect() as conn:
+            rows = conn.execute(sql, params).fetchall()
+        conn.close()
+
+        return [{
+            "id": paper_id,
+            "title": title,
+            "authors": authors.split(", ") if authors else [],
+            "published": published,
+            "pdf_url": pdf_url,
+            # bm25() is lower-is-better; flip it so higher means more relevant
+            "score": round(-score, 4)
+        } for paper_id, title, authors, published, pdf_url, score in rows]
@@ -0,0 +1,182 @@
+import io
+import json
+import mmap
+import os
+import re
+import sys
+import threading
+import urllib.request
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+# Uncompressed characters per stored chunk; reads only inflate the chunks they touch
+CHUNK_CHARS = 16384
+
+# Lines that look like paper section headings, e.g. "Abstract", "2 Related Work", "3.1. Method"
+SECTION_PATTERN = re.compile(
+    r"^(?:(?:\d+(?:\.\d+)*\.?|[IVX]+\.)\s+[A-Z][^\n]{0,80}"
+    r"|Abstract|Introduction|Related Work|Background|Methods?|Experiments?"
+    r"|Results|Discussion|Conclusions?|References|Acknowledge?ments?|Appendix[^\n]{0,60})\s*$",
+    re.MULTILINE
+)
+
+
+class UrlFetcher:
+    """Download PDFs over HTTP"""
+
+    def __init__(self, timeout: float = 30.0):
+        self.timeout = timeout
+
+    def __call__(self, paper_id: str, pdf_url: str) -> bytes:
+        with urllib.request.urlopen(pdf_url, timeout=self.timeout) as response:
+            return response.read()
+
+
+class LocalFileFetcher:
+    """Read PDFs from <directory>/<paper_id>.pdf, e.g. a test fixture directory"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def __call__(self, paper_id: str, pdf_url: str) -> bytes:
+        with open(os.path.join(self.directory, f"{paper_id}.pdf"), "rb") as pdf_file:
+            return pdf_file.read()
+
+
+def extract_pdf_text(data: bytes) -> str:
+    """Extract plain text from PDF bytes with pypdf"""
+    try:
+        from pypdf import PdfReader
+    except ImportError:
+        raise RuntimeError("pypdf is not installed; run uv sync")
+
+    reader = PdfReader(io.BytesIO(data))
+    return "\n".join(page.extract_text() or "" for page in reader.pages)
+
+
+def find_sections(text: str) -> List[Tuple[str, int]]:
+    """Return (heading, character offset) for each detected section heading"""
+    return [(match.group(0).strip(), match.start()) for match in SECTION_PATTERN.finditer(text)]
+
+
+class PaperTextStore:
+    """Chunked, zlib-compressed paper text on disk, read back through mmap.
+
+    Each paper is stored as <id>.bin (concatenated compressed chunks) and
+    <id>.json (chunk byte offsets, total length and section offsets). The
+    index is written last, so its presence means the text is complete.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+
+    def _paths(self, paper_id: str) -> Tuple[str, str]:
+        safe_id = paper_id.replace("/", "_")
+        return (os.path.join(self.directory, f"{safe_id}.bin"),
+                os.path.join(self.directory, f"{safe_id}.json"))
+
+    def has(self, paper_id: str) -> bool:
+        return os.path.isfile(self._paths(paper_id)[1])
+
+    def write(self, paper_id: str, text: str) -> None:
+        os.makedirs(self.directory, exist_ok=True)
+        bin_path, index_path = self._paths(paper_id)
+
+        offsets = [0]
+        with open(bin_path + ".tmp", "wb") as bin_file:
+            for start in range(0, len(text), CHUNK_CHARS):
+                compressed = zlib.compress(text[start:start + CHUNK_CHARS].encode("utf-8"))
+                bin_file.write(compressed)
+                offsets.append(offsets[-1] + len(compressed))
+        os.replace(bin_path + ".tmp", bin_path)
+
+        index = {
+            "length": len(text),
+            "chunk_chars": CHUNK_CHARS,
+            "offsets": offsets,
+            "sections": find_sections(text)
+        }
+        with open(index_path + ".tmp", "w") as index_file:
+            json.dump(index, index_file)
+        os.replace(index_path + ".tmp", index_path)
+
+    def load_index(self, paper_id: str) -> Optional[dict]:
+        try:
+            with open(self._paths(paper_id)[1], "r") as index_file:
+                return json.load(index_file)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def read(self, paper_id: str, offset: int, length: int) -> str:
+        """Read length characters starting at offset, inflating only the chunks needed"""
+        if offset < 0:
+            raise ValueError(f"offset must be >= 0, got {offset}")
+        index = self.load_index(paper_id)
+        if index is None or length <= 0:
+            return ""
+
+        chunk_chars = index["chunk_chars"]
+        offsets = index["offsets"]
+        end = min(offset + length, index["length"])
+        if offset >= end:
+            return ""
+
+        first, last = offset // chunk_chars, (end - 1) // chunk_chars
+        with open(self._paths(paper_id)[0], "rb") as bin_file:
+            with mmap.mmap(bin_file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                text = "".join(
+                    zlib.decompress(mapped[offsets[i]:offsets[i + 1]]).decode("utf-8")
+                    for i in range(first, last + 1)
+                )
+        base = first * chunk_chars
+        return text[offset - base:end - base]
+
+
+class PdfPipeline:
+    """Bounded background pool that downloads and extracts PDFs into a PaperTextStore"""
+
+    def __init__(
+        self,
+        store: PaperTextStore,
+        fetcher: Optional[Callable[[str, str], bytes]] = None,
+        extractor: Callable[[bytes], str] = extract_pdf_text,
+        max_workers: int = 2,
+        max_pending: int = 32
+    ):
+        self.store = store
+        self.fetcher = fetcher or UrlFetcher()
+        self.extractor = extractor
+        self.max_pending = max_pending
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="pdf")
+        self._lock = threading.Lock()
+        self._pending: set = set()
+        self.failures: Dict[str, str] = {}
+
+    def submit(self, paper_id: str, pdf_url: str) -> bool:
+        """Queue a paper unless it is stored, already queued, or the queue is full"""
+        if not pdf_url or self.store.has(paper_id):
+            return False
+        with self._lock:
+            if paper_id in self._pending or len(self._pending) >= self.max_pending:
+                return False
+            self._pending.add(paper_id)
+            self.failures.pop(paper_id, None)
+        self._executor.submit(self._process, paper_id, pdf_url)
+        return True
+
+    def is_pending(self, paper_id: str) -> bool:
+        with self._lock:
+            return paper_id in self._pending
+
+    def _process(self, paper_id: str, pdf_url: str) -> None:
+        try:
+            text = self.extractor(self.fetcher(paper_id, pdf_url))
+            self.store.write(paper_id, text)
+        except Exception as e:
+            self.failures[paper_id] = str(e)
+            print(f"Failed to process PDF for {paper_id}: {e}", file=sys.stderr)
+        finally:
+            with self._lock:
+                self._pending.discard(paper_id)
@@ -0,0 +1,142 @@
+import os
+import re
+import threading
+import zlib
+from typing import Callable, List, Optional, Sequence, Tuple
+
+
+def _numpy():
+    try:
+        import numpy
+    except ImportError:
+        raise RuntimeError("numpy is not installed; run uv sync")
+    return numpy
+
+
+class HashingEmbedder:
+    """Offline embedding: signed feature hashing of words and character trigrams.
+
+    Catches spelling/morphology variants ("agent" vs "Agents") but not
+    synonyms; pass a real sentence-embedding function to PaperVectorIndex
+    for that.
+    """
+
+    def __init__(self, dim: int = 512):
+        self.dim = dim
+
+    def _features(self, text: str) -> List[str]:
+        words = re.findall(r"\w+", text.lower())
+        features = [f"w:{word}" for word in words]
+        for word in words:
+            padded = f"#{word}#"
+            features.extend(f"c:{padded[i:i + 3]}" for i in range(len(padded) - 2))
+        return features
+
+    def __call__(self, texts: Sequence[str]):
+        np = _numpy()
+        matrix = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for feature in self._features(text):
+                # crc32 is stable across processes, unlike hash()
+                h = zlib.crc32(feature.encode("utf-8"))
+                matrix[row, h % self.dim] += 1.0 if h & 0x80000000 else -1.0
+        # Sublinear term frequency, then L2-normalize so dot product == cosine
+        matrix = np.sign(matrix) * np.log1p(np.abs(matrix))
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return matrix / norms
+
+
+class PaperVectorIndex:
+    """Append-only float32 matrix of normalized embeddings, memory-mapped for search.
+
+    Rows live in vectors.f32 and their keys, one per line, in ids.txt.
+    Only as many rows as both files agree on are loaded, so a torn write
+    only loses the tail.
+    """
+
+    def __init__(self, directory: str, embedder: Optional[Callable[[Sequence[str]], object]] = None, dim: int = 512):
+        self.directory = directory
+        self.embedder = embedder or HashingEmbedder(dim)
+        self.dim = dim
+        self._vectors_path = os.path.join(directory, "vectors.f32")
+        self._ids_path = os.path.join(directory, "ids.txt")
+        self._lock = threading.Lock()
+        self._ids: Optional[List[str]] = None
+        self._positions: dict = {}
+        self._matrix = None
+
+    def _load(self) -> None:
+        if self._ids is not None:
+            return
+        np = _numpy()
+        try:
+            with open(self._ids_path, "r") as ids_file:
+                ids = ids_file.read().splitlines()
+        except FileNotFoundError:
+            ids = []
+        row_bytes = self.dim * 4
+        size = os.path.getsize(self._vectors_path) if os.path.exists(self._vectors_path) else 0
+        count = min(len(ids), size // row_bytes)
+        self._ids = ids[:count]
+        self._positions = {key: i for i, key in enumerate(self._ids)}
+        self._matrix = (np.memmap(self._vectors_path, dtype=np.float32, mode="r", shape=(count, self.dim))
+                        if count else np.zeros((0, self.dim), dtype=np.float32))
+
+    def __contains__(self, key: str) -> bool:
+        with self._lock:
+            self._load()
+            return key in self._positions
+
+    def keys(self) -> List[str]:
+        with self._lock:
+            self._load()
+            return list(self._ids)
+
+    def add(self, items: Sequence[Tuple[str, str]]) -> int:
+        """Embed and append (key, text) pairs whose key is not indexed yet"""
+        with self._lock:
+            self._load()
+            new = [(key, text) for key, text in dict(items).items() if key not in self._positions]
+            if not new:
+                return 0
+            vectors = self.embedder([text for _, text in new]).astype("float32")
+
+            os.makedirs(self.directory, exist_ok=True)
+            # Trim any torn tail before appending so rows and keys stay aligned
+            with open(self._vectors_path, "ab") as vectors_file:
+                vectors_file.truncate(len(self._ids) * self.dim * 4)
+                vectors_file.write(vectors.tobytes())
+            with open(self._ids_path, "w") as ids_file:
+                ids_file.write("".join(f"{key}\n" for key in self._ids + [key for key, _ in new]))
+
+            # Remap on next use to pick up the appended rows
+            self._ids = None
+            self._matrix = None
+            return len(new)
+
+    def search(self, text: Optional[str] = None, key: Optional[str] = None, k: int = 5) -> List[Tuple[str, float]]:
+        """Top-k (key, cosine) by text, or by the stored vector of key (excluding itself)"""
+        np = _numpy()
+        with self._lock:
+            self._load()
+            matrix, ids = self._matrix, self._ids
+            position = self._positions.get(key) if key is not None else None
+        if key is not None:
+            if position is None:
+                return []
+            query = np.array(matrix[position])
+        else:
+            query = self.embedder([text or ""])[0]
+        if not len(ids):
+            return []
+
+        scores = matrix @ query
+        if position is not None:
+            scores[position] = -np.inf
+        k = min(k, len(ids) - (key is not None))
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top])]
+        return [(ids[i], float(scores[i])) for i in top]
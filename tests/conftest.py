@@ -0,0 +1,8 @@
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# The application and servers modules import each other by bare name, as when run as scripts
+for directory in ("application", "servers"):
+    sys.path.insert(0, os.path.join(ROOT, directory))
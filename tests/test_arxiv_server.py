@@ -0,0 +1,150 @@
+import asyncio
+import json
+
+import numpy as np
+import pytest
+
+import arxiv_server
+from paper_index import PaperIndex, canonical_topic
+from paper_text import PaperTextStore
+from paper_vectors import PaperVectorIndex
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+@pytest.fixture
+def server(tmp_path, monkeypatch):
+    """arxiv_server on a temporary paper directory, with arXiv replaced by a counter"""
+    monkeypatch.setattr(arxiv_server, "PAPER_DIR", str(tmp_path))
+    monkeypatch.setattr(arxiv_server, "_legacy_imported", False)
+    monkeypatch.setattr(arxiv_server, "paper_index", PaperIndex(str(tmp_path / "index.sqlite")))
+    monkeypatch.setattr(arxiv_server, "text_store", PaperTextStore(str(tmp_path / "texts")))
+    monkeypatch.setattr(arxiv_server, "paper_vectors", PaperVectorIndex(str(tmp_path / "vectors" / "papers")))
+    monkeypatch.setattr(arxiv_server, "topic_vectors", None)
+    monkeypatch.setattr(arxiv_server.pdf_pipeline, "submit", lambda paper_id, pdf_url: False)
+
+    fetches = []
+
+    def fake_fetch(topic, max_results):
+        fetches.append(topic)
+        return {f"{len(fetches)}.{i}": {
+            "title": f"{topic} {i}", "authors": ["A. Author"], "summary": topic,
+            "pdf_url": "", "published": "2024-01-01"
+        } for i in range(max_results)}
+
+    monkeypatch.setattr(arxiv_server, "_fetch_arxiv", fake_fetch)
+    return fetches
+
+
+def test_repeated_topic_is_answered_locally(server):
+    first = run(arxiv_server.search_papers("Reinforcement Learning", 3))
+    assert run(arxiv_server.search_papers("reinforcement-learning", 3)) == first
+    assert server == ["Reinforcement Learning"]
+
+
+@pytest.mark.parametrize("earlier,later", [
+    ("reinforcement learning", "deep reinforcement learning"),
+    ("reinforcement learning", "inverse reinforcement learning"),
+    ("deep reinforcement learning", "reinforcement learning"),
+    ("machine learning", "machine unlearning"),
+])
+def test_related_topics_are_not_deduplicated(server, earlier, later):
+    first = run(arxiv_server.search_papers(earlier, 3))
+    second = run(arxiv_server.search_papers(later, 3))
+    assert server == [earlier, later]
+    assert not set(first) & set(second)
+
+
+class LookupEmbedder:
+    """Stands in for a sentence embedder: fixed vectors per topic"""
+
+    VECTORS = {
+        "LLM agents": [1.0, 0.0, 0.0, 0.0],
+        "language model agents": [0.99, 0.14, 0.0, 0.0],
+        "reinforcement learning": [0.0, 0.0, 1.0, 0.0],
+        "deep reinforcement learning": [0.0, 0.0, 0.6, 0.8],
+    }
+
+    def __call__(self, texts):
+        return np.array([self.VECTORS[text] for text in texts], dtype=np.float32)
+
+
+@pytest.fixture
+def semantic(server, tmp_path, monkeypatch):
+    monkeypatch.setattr(arxiv_server, "topic_vectors",
+                        PaperVectorIndex(str(tmp_path / "vectors" / "topics"), embedder=LookupEmbedder(), dim=4))
+    return server
+
+
+def test_semantic_embedder_reuses_paraphrased_topic(semantic):
+    first = run(arxiv_server.search_papers("LLM agents", 3))
+    assert run(arxiv_server.search_papers("language model agents", 3)) == first
+    assert semantic == ["LLM agents"]
+    assert arxiv_server.topic_vectors.keys() == [canonical_topic("LLM agents")]
+
+
+def test_semantic_embedder_keeps_distinct_topics_apart(semantic):
+    run(arxiv_server.search_papers("reinforcement learning", 3))
+    run(arxiv_server.search_papers("deep reinforcement learning", 3))
+    assert semantic == ["reinforcement learning", "deep reinforcement learning"]
+
+
+def test_stale_topic_is_fetched_again(server, monkeypatch):
+    first = run(arxiv_server.search_papers("graph neural networks", 3))
+    monkeypatch.setattr(arxiv_server, "TOPIC_CACHE_TTL", -1)
+    second = run(arxiv_server.search_papers("graph neural networks", 3))
+    assert server == ["graph neural networks"] * 2
+    assert second != first
+
+    # Within the TTL the latest fetch is served, in its relevance order
+    monkeypatch.setattr(arxiv_server, "TOPIC_CACHE_TTL", 3600)
+    assert run(arxiv_server.search_papers("graph neural networks", 2)) == second[:2]
+    assert len(server) == 2
+
+
+def test_refresh_skips_cached_topic(server):
+    run(arxiv_server.search_papers("graph neural networks", 3))
+    run(arxiv_server.search_papers("graph neural networks", 3, refresh=True))
+    assert len(server) == 2
+
+
+def test_larger_request_than_cached_is_fetched(server):
+    run(arxiv_server.search_papers("graph neural networks", 2))
+    assert len(run(arxiv_server.search_papers("graph neural networks", 4))) == 4
+    assert len(server) == 2
+
+
+def test_legacy_topic_directory_is_reused(server, tmp_path):
+    (tmp_path / "graph_neural_networks").mkdir()
+    (tmp_path / "graph_neural_networks" / "papers_info.json").write_text(json.dumps({
+        "old.1": {"title": "GNNs", "authors": [], "summary": "", "pdf_url": "", "published": "2019-01-01"},
+        "old.2": {"title": "GCNs", "authors": [], "summary": "", "pdf_url": "", "published": "2018-01-01"},
+    }))
+    assert run(arxiv_server.search_papers("Graph Neural Networks", 2)) == ["old.1", "old.2"]
+    assert server == []
+
+
+def test_legacy_import_runs_once_across_threads(server, monkeypatch):
+    import threading
+    import time
+    from concurrent.futures import ThreadPoolExecutor
+
+    calls = []
+    barrier = threading.Barrier(8)
+
+    def slow_sync(paper_dir):
+        calls.append(paper_dir)
+        time.sleep(0.05)
+        return 0
+
+    monkeypatch.setattr(arxiv_server.paper_index, "sync_directory", slow_sync)
+
+    def first_call(_):
+        barrier.wait()
+        arxiv_server._import_legacy_topics()
+
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        list(pool.map(first_call, range(8)))
+    assert len(calls) == 1
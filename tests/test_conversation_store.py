@@ -0,0 +1,160 @@
+import asyncio
+import json
+import os
+
+import pytest
+
+from conversation_store import ConversationStore
+from llm_adapter import ChatMessage
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def message(role: str, content: str) -> ChatMessage:
+    return ChatMessage(role=role, content=content)
+
+
+def contents(history):
+    return [(m.role, m.content) for m in history]
+
+
+async def record_all(store: ConversationStore, session_id: str, *histories) -> None:
+    for history in histories:
+        store.record(session_id, history)
+    await store.flush()
+
+
+def test_round_trip(tmp_path):
+    tool_call = {"id": "call_1", "type": "function", "function": {"name": "search_papers", "arguments": "{}"}}
+    history = [
+        message("user", "find papers"),
+        ChatMessage(role="assistant", content=None, tool_calls=[tool_call]),
+        ChatMessage(role="tool", content="[]", tool_call_id="call_1"),
+        message("assistant", "none found"),
+    ]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0)
+        await record_all(store, "s1", history[:2], history)
+        await store.close()
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    loaded = run(scenario())
+    assert contents(loaded) == contents(history)
+    assert loaded[1].tool_calls == [tool_call]
+    assert loaded[2].tool_call_id == "call_1"
+
+
+def test_appends_only_new_messages(tmp_path):
+    history = [message("user", "a"), message("assistant", "b")]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0)
+        await record_all(store, "s1", history[:1])
+        await record_all(store, "s1", history, history)
+        await store.close()
+
+    run(scenario())
+    with open(tmp_path / "s1.0.log") as log:
+        records = [json.loads(line) for line in log]
+    assert [r["op"] for r in records] == ["append", "append"]
+
+
+@pytest.mark.parametrize("after", [[], [message("user", "a")], [message("user", "other")]])
+def test_reset_after_clear_or_rollback(tmp_path, after):
+    history = [message("user", "a"), message("assistant", "b")]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0)
+        await record_all(store, "s1", history)
+        # A new list, as after clear_history or a cancelled turn's rollback
+        await record_all(store, "s1", list(after))
+        await store.close()
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    assert contents(run(scenario())) == contents(after)
+    with open(tmp_path / "s1.0.log") as log:
+        assert json.loads(log.readlines()[-1])["op"] == "reset"
+
+
+def test_compaction_starts_new_generation(tmp_path):
+    history = [message("user" if i % 2 == 0 else "assistant", str(i)) for i in range(7)]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0, snapshot_every=3)
+        for end in range(1, len(history) + 1):
+            await record_all(store, "s1", history[:end])
+        await store.close()
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    assert contents(run(scenario())) == contents(history)
+    with open(tmp_path / "s1.snapshot.json") as snapshot_file:
+        snapshot = json.load(snapshot_file)
+    # 7 records at 3 per log: compacted twice, one record left in generation 2's log
+    assert snapshot["generation"] == 2
+    assert len(snapshot["messages"]) == 6
+    assert sorted(os.listdir(tmp_path)) == ["s1.2.log", "s1.snapshot.json"]
+
+
+def test_reopened_store_continues_current_generation(tmp_path):
+    history = [message("user", str(i)) for i in range(5)]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0, snapshot_every=3)
+        await record_all(store, "s1", history[:1], history[:2])
+        await store.close()
+        # A new process: count the existing log records toward the next compaction
+        store = ConversationStore(str(tmp_path), flush_delay=0, snapshot_every=3)
+        loaded = await store.load("s1")
+        await record_all(store, "s1", loaded + history[2:3])
+        await store.close()
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    # The third record reaches snapshot_every only if the first two were counted
+    assert contents(run(scenario())) == contents(history[:3])
+    assert sorted(os.listdir(tmp_path)) == ["s1.snapshot.json"]
+    with open(tmp_path / "s1.snapshot.json") as snapshot_file:
+        assert json.load(snapshot_file)["generation"] == 1
+
+
+def test_torn_final_log_line_is_ignored(tmp_path):
+    history = [message("user", "a"), message("assistant", "b")]
+
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0)
+        await record_all(store, "s1", history)
+        await store.close()
+        with open(tmp_path / "s1.0.log", "a") as log:
+            log.write('{"op": "append", "mess')
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    assert contents(run(scenario())) == contents(history)
+
+
+def test_missing_session_loads_empty(tmp_path):
+    assert run(ConversationStore(str(tmp_path)).load("nobody")) == []
+
+
+def test_rejects_unsafe_session_id(tmp_path):
+    store = ConversationStore(str(tmp_path))
+    with pytest.raises(ValueError):
+        store.record("../escape", [message("user", "a")])
+
+
+def test_records_queued_during_write_are_flushed(tmp_path):
+    async def scenario():
+        store = ConversationStore(str(tmp_path), flush_delay=0.01)
+        history = [message("user", "a")]
+        store.record("s1", history)
+        await asyncio.sleep(0.015)  # the delayed flush has started its write
+        history = history + [message("assistant", "b")]
+        store.record("s1", history)
+        for _ in range(100):
+            if not store._pending and store._flush_task.done():
+                break
+            await asyncio.sleep(0.01)
+        return await ConversationStore(str(tmp_path)).load("s1")
+
+    assert contents(run(scenario())) == [("user", "a"), ("assistant", "b")]
@@ -0,0 +1,104 @@
+import asyncio
+from types import SimpleNamespace
+
+from llm_adapter import ChatMessage, MessageBuffer
+from openai_adapter import OpenAIAdapter
+
+
+class CountingConverter:
+    def __init__(self):
+        self.converted = []
+
+    def __call__(self, message: ChatMessage) -> dict:
+        self.converted.append(message.content)
+        return {"role": message.role, "content": message.content}
+
+
+def messages(*contents):
+    return [ChatMessage(role="user", content=content) for content in contents]
+
+
+def contents(wire):
+    return [item["content"] for item in wire]
+
+
+def test_appended_messages_convert_only_the_tail():
+    buffer, convert = MessageBuffer(), CountingConverter()
+    history = messages("a", "b")
+    assert contents(buffer.sync(history, convert)) == ["a", "b"]
+    history += messages("c", "d")
+    assert contents(buffer.sync(history, convert)) == ["a", "b", "c", "d"]
+    assert convert.converted == ["a", "b", "c", "d"]
+    assert contents(buffer.sync(list(history), convert)) == ["a", "b", "c", "d"]
+    assert len(convert.converted) == 4
+
+
+def test_replaced_middle_message_resyncs_from_there():
+    buffer, convert = MessageBuffer(), CountingConverter()
+    history = messages("a", "b", "c")
+    buffer.sync(history, convert)
+    history[1] = ChatMessage(role="user", content="B")
+    assert contents(buffer.sync(history, convert)) == ["a", "B", "c"]
+    assert convert.converted == ["a", "b", "c", "B", "c"]
+
+
+def test_rollback_after_cancel_drops_the_tail():
+    buffer, convert = MessageBuffer(), CountingConverter()
+    history = messages("a", "b")
+    buffer.sync(history, convert)
+    turn = history + messages("cancelled question", "partial answer")
+    buffer.sync(turn, convert)
+
+    # The cancelled turn is rolled back, then a new one starts
+    assert contents(buffer.sync(history, convert)) == ["a", "b"]
+    retry = history + messages("new question")
+    assert contents(buffer.sync(retry, convert)) == ["a", "b", "new question"]
+    assert contents(buffer.sync([], convert)) == []
+
+
+def test_sync_returns_a_copy():
+    buffer, convert = MessageBuffer(), CountingConverter()
+    history = messages("a", "b")
+    sent = buffer.sync(history, convert)
+    buffer.sync(history[:1], convert)
+    assert contents(sent) == ["a", "b"]
+
+
+class FakeCompletions:
+    def __init__(self):
+        self.requests = []
+
+    async def create(self, **kwargs):
+        self.requests.append(kwargs)
+        message = SimpleNamespace(content="ok", tool_calls=None)
+        return SimpleNamespace(choices=[SimpleNamespace(message=message)], usage=None)
+
+
+def make_adapter():
+    adapter = OpenAIAdapter("test-model", api_key="test")
+    completions = FakeCompletions()
+    adapter._client = SimpleNamespace(chat=SimpleNamespace(completions=completions))
+    return adapter, completions
+
+
+def test_buffers_are_kept_per_conversation_and_evicted():
+    adapter, completions = make_adapter()
+    first, second = messages("from A"), messages("from B")
+
+    async def scenario():
+        await adapter.chat_completion(first, conversation_id="A")
+        await adapter.chat_completion(second, conversation_id="B")
+        await adapter.chat_completion(first + messages("more A"), conversation_id="A")
+
+    asyncio.run(scenario())
+    assert [contents(request["messages"]) for request in completions.requests] == [
+        ["from A"], ["from B"], ["from A", "more A"]
+    ]
+    assert "conversation_id" not in completions.requests[0]
+    assert set(adapter._buffers) == {"A", "B"}
+
+    adapter.end_conversation("A")
+    assert set(adapter._buffers) == {"B"}
+    adapter.end_conversation("missing")
+    adapter.end_conversation(None)
+    assert set(adapter._buffers) == {"B"}
@@ -0,0 +1,265 @@
+import asyncio
+import json
+
+import pytest
+from mcp import types
+
+from cassette import RecordedFunction, RecordedToolCall
+from llm_adapter import ChatResponse, LLMAdapter
+from multi_server_chatbot import MCP_ChatBot, TurnBudget
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+def tool_response(name: str = "search_papers", call_id: str = "call_1", usage=None, **args) -> ChatResponse:
+    call = RecordedToolCall(id=call_id, function=RecordedFunction(name, json.dumps(args or {"topic": "x"})))
+    return ChatResponse(content=None, tool_calls=[call], usage=usage)
+
+
+class ScriptedAdapter(LLMAdapter):
+    """Answers tool-enabled calls with respond(calls) and tool_choice="none" calls with final"""
+
+    def __init__(self, respond, final="Final answer.", delay: float = 0.0):
+        super().__init__("test-model", enable_caching=False)
+        self.respond = respond
+        self.final = final
+        self.delay = delay
+        self.calls = []
+
+    async def chat_completion(self, messages, tools=None, max_tokens=2048, temperature=0.7, **kwargs):
+        self.calls.append({"messages": list(messages), **kwargs})
+        if kwargs.get("tool_choice") == "none":
+            return ChatResponse(content=self.final)
+        await asyncio.sleep(self.delay)
+        return self.respond(len(self.calls))
+
+    @property
+    def synthesis_calls(self):
+        return [call for call in self.calls if call.get("tool_choice") == "none"]
+
+    def get_available_models(self):
+        return [self.model]
+
+    @property
+    def provider_name(self):
+        return "Scripted"
+
+    @property
+    def supports_caching(self):
+        return False
+
+    @property
+    def requires_manual_cache_control(self):
+        return False
+
+
+class FakeSession:
+    """MCP session whose tools return their arguments after delay seconds"""
+
+    def __init__(self, delay: float = 0.0):
+        self.delay = delay
+        self.calls = []
+        self.cancelled = []
+        self._request_id = 0
+
+    async def call_tool(self, name, arguments=None):
+        self.calls.append((name, arguments))
+        self._request_id += 1
+        await asyncio.sleep(self.delay)
+        if name == "search_papers":
+            text = json.dumps(["p1", "p2"])
+        else:
+            text = f"{name} {json.dumps(arguments, sort_keys=True)}"
+        return types.CallToolResult(content=[types.TextContent(type="text", text=text)])
+
+    async def send_notification(self, notification):
+        self.cancelled.append(notification.root.params.requestId)
+
+
+def make_bot(adapter, session=None, **budget) -> MCP_ChatBot:
+    bot = MCP_ChatBot(llm_adapter=adapter, budget=TurnBudget(**budget), prefetch_budget=0)
+    session = session or FakeSession()
+    bot._set_server_tools("research", [
+        {"type": "function", "function": {"name": name, "description": "", "parameters": {}}}
+        for name in ("search_papers", "extract_info")
+    ])
+    for name in ("search_papers", "extract_info"):
+        bot.tool_to_session[name] = session
+    return bot
+
+
+def final_answer(bot: MCP_ChatBot) -> str:
+    assert bot.conversation_history[-1].role == "assistant"
+    return bot.conversation_history[-1].content
+
+
+def test_answer_without_tools_needs_no_synthesis():
+    adapter = ScriptedAdapter(lambda n: ChatResponse(content="Hello."))
+    bot = make_bot(adapter)
+    run(bot.process_query("hi"))
+    assert final_answer(bot) == "Hello."
+    assert adapter.synthesis_calls == []
+    assert not bot.metrics
+
+
+def test_tool_iteration_limit_synthesizes_once():
+    adapter = ScriptedAdapter(lambda n: tool_response(call_id=f"call_{n}", topic=str(n)))
+    session = FakeSession()
+    bot = make_bot(adapter, session, max_tool_iterations=2)
+    run(bot.process_query("find papers"))
+
+    assert len(session.calls) == 2
+    assert len(adapter.synthesis_calls) == 1
+    assert final_answer(bot) == "Final answer."
+    assert bot.metrics["budget_breaches"] == 1
+    assert bot.metrics["budget_breach_tool_iterations"] == 1
+    # The third round of tool calls is dropped rather than left unanswered
+    last = adapter.synthesis_calls[0]["messages"][-1]
+    assert last.role == "tool" and last.tool_call_id == "call_2"
+
+
+def test_deadline_during_tool_call_synthesizes_once():
+    adapter = ScriptedAdapter(lambda n: tool_response())
+    session = FakeSession(delay=5)
+    bot = make_bot(adapter, session, deadline=0.05)
+    run(bot.process_query("find papers"))
+
+    assert len(adapter.synthesis_calls) == 1
+    assert final_answer(bot) == "Final answer."
+    assert bot.metrics["budget_breach_deadline"] == 1
+    assert bot.metrics["cancelled_tool_calls"] == 0
+    assert session.cancelled == [0]
+    # The interrupted tool call still gets a result
+    last = adapter.synthesis_calls[0]["messages"][-1]
+    assert last.role == "tool" and last.content.startswith("Not run")
+
+
+def test_deadline_during_llm_call_is_not_a_cancellation():
+    adapter = ScriptedAdapter(lambda n: ChatResponse(content="late"), delay=5)
+    bot = make_bot(adapter, deadline=0.05)
+    run(bot.process_query("hi"))
+
+    assert len(adapter.synthesis_calls) == 1
+    assert bot.metrics["budget_breach_deadline"] == 1
+    assert bot.metrics["cancelled_llm_calls"] == 0
+    assert bot.metrics["cancelled_turns"] == 0
+
+
+@pytest.mark.parametrize("budget,usage,breach", [
+    ({"max_input_tokens": 100}, {"prompt_tokens": 150, "completion_tokens": 10}, "input_tokens"),
+    ({"max_output_tokens": 100}, {"prompt_tokens": 10, "completion_tokens": 150}, "output_tokens"),
+])
+def test_token_limits_synthesize_once(budget, usage, breach):
+    adapter = ScriptedAdapter(lambda n: tool_response(usage=usage))
+    session = FakeSession()
+    bot = make_bot(adapter, session, **budget)
+    run(bot.process_query("find papers"))
+
+    assert session.calls == []
+    assert len(adapter.synthesis_calls) == 1
+    assert bot.metrics["budget_breaches"] == 1
+    assert bot.metrics[f"budget_breach_{breach}"] == 1
+
+
+def test_empty_response_falls_back_to_synthesis():
+    adapter = ScriptedAdapter(lambda n: ChatResponse(content=None))
+    bot = make_bot(adapter)
+    run(bot.process_query("hi"))
+
+    assert len(adapter.synthesis_calls) == 1
+    assert final_answer(bot) == "Final answer."
+    assert bot.metrics["empty_responses"] == 1
+    assert bot.metrics["budget_breaches"] == 0
+
+
+def test_empty_synthesis_returns_fallback_message():
+    adapter = ScriptedAdapter(lambda n: ChatResponse(content=""), final=None)
+    bot = make_bot(adapter)
+    run(bot.process_query("hi"))
+
+    assert final_answer(bot).startswith("⏱️ I couldn't reach an answer")
+    assert bot.metrics["synthesis_failed"] == 1
+    assert bot.metrics["budget_breaches"] == 0
+
+
+def test_client_cancel_counts_llm_call_in_flight():
+    adapter = ScriptedAdapter(lambda n: ChatResponse(content="late"), delay=5)
+    bot = make_bot(adapter)
+
+    async def scenario():
+        task = asyncio.create_task(bot.process_query("hi"))
+        await asyncio.sleep(0.05)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+
+    run(scenario())
+    assert bot.conversation_history == []
+    assert bot.metrics["cancelled_turns"] == 1
+    assert bot.metrics["cancelled_llm_calls"] == 1
+
+
+def prefetching_bot(adapter, session) -> MCP_ChatBot:
+    bot = make_bot(adapter, session)
+    bot.prefetch_budget = 5
+    return bot
+
+
+def test_prefetch_hit_and_waste():
+    script = {1: tool_response(topic="x"), 2: tool_response("extract_info", "call_2", paper_id="p1")}
+    adapter = ScriptedAdapter(lambda n: script.get(n, ChatResponse(content="Done.")))
+    session = FakeSession(delay=0.05)
+    bot = prefetching_bot(adapter, session)
+    run(bot.process_query("find papers"))
+
+    # search_papers returned p1 and p2; only p1 was asked for
+    assert bot.metrics["prefetch_started"] == 2
+    assert bot.metrics["prefetch_hits"] == 1
+    assert bot.metrics["prefetch_wasted"] == 1
+    assert bot.metrics["cancelled_tool_calls"] == 0
+    assert [name for name, _ in session.calls].count("extract_info") == 2
+    tool_results = [m for m in adapter.calls[-1]["messages"] if m.role == "tool"]
+    assert tool_results[-1].tool_call_id == "call_2" and "p1" in tool_results[-1].content
+
+
+def test_prefetch_respects_budget():
+    adapter = ScriptedAdapter(lambda n: tool_response() if n == 1 else ChatResponse(content="Done."))
+    bot = prefetching_bot(adapter, FakeSession())
+    bot.prefetch_budget = 1
+    run(bot.process_query("find papers"))
+    assert bot.metrics["prefetch_started"] == 1
+
+
+def test_cancelled_turn_counts_awaited_prefetch_once():
+    script = {1: tool_response(topic="x"), 2: tool_response("extract_info", "call_2", paper_id="p1")}
+    adapter = ScriptedAdapter(lambda n: script.get(n, ChatResponse(content="Done.")))
+    session = FakeSession()
+    bot = prefetching_bot(adapter, session)
+    search = session.call_tool
+
+    async def slow_extract(name, arguments=None):
+        if name == "extract_info":
+            await asyncio.sleep(5)
+        return await search(name, arguments)
+
+    session.call_tool = slow_extract
+
+    async def scenario():
+        task = asyncio.create_task(bot.process_query("find papers"))
+        # Cancel while the turn waits on the p1 prefetch
+        while bot.metrics["prefetch_hits"] == 0:
+            await asyncio.sleep(0.001)
+        task.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await task
+        await asyncio.sleep(0.01)
+
+    run(scenario())
+    assert bot.metrics["cancelled_turns"] == 1
+    # The awaited prefetch is the turn's cancelled tool call; the other one is waste, not a cancel
+    assert bot.metrics["cancelled_tool_calls"] == 1
+    assert bot.metrics["prefetch_wasted"] == 1
+    assert bot.metrics["cancelled_llm_calls"] == 0
+    assert len(session.cancelled) == 2
@@ -0,0 +1,111 @@
+import json
+import os
+
+import pytest
+
+from paper_index import PaperIndex, _stem, canonical_topic
+
+
+def paper(title: str) -> dict:
+    return {"title": title, "authors": ["A. Author"], "summary": f"About {title}",
+            "pdf_url": "", "published": "2024-01-01"}
+
+
+@pytest.mark.parametrize("word,stem", [
+    ("networks", "network"),
+    ("theories", "theory"),
+    ("classes", "class"),
+    ("boxes", "box"),
+    ("approaches", "approach"),
+    ("meshes", "mesh"),
+    ("class", "class"),
+    ("corpus", "corpus"),
+    ("analysis", "analysis"),
+    ("gas", "gas"),
+    ("ties", "tie"),
+])
+def test_stem(word, stem):
+    assert _stem(word) == stem
+
+
+@pytest.mark.parametrize("topic,key", [
+    ("Machine Learning", "machine_learning"),
+    ("machine-learning", "machine_learning"),
+    ("machine_learnings", "machine_learning"),
+    ("  Graph   Neural Networks ", "graph_neural_network"),
+    ("The Theory of Everything", "theory_everything"),
+    ("learning to rank with transformers", "learning_rank_transformer"),
+    ("GPT-4 evaluation", "gpt_4_evaluation"),
+    ("", "untitled"),
+    ("the of and", "untitled"),
+    ("???", "untitled"),
+])
+def test_canonical_topic(topic, key):
+    assert canonical_topic(topic) == key
+
+
+def test_topic_fetch_keeps_latest_relevance_order(tmp_path):
+    index = PaperIndex(str(tmp_path / "index.sqlite"))
+    assert index.topic_fetch("graph networks") is None
+
+    index.add_papers({"b": paper("B"), "a": paper("A")}, topic="Graph Networks")
+    fetched, paper_ids = index.topic_fetch("graph-network")
+    assert paper_ids == ["b", "a"]
+
+    index.add_papers({"c": paper("C"), "a": paper("A")}, topic="graph networks")
+    refetched, paper_ids = index.topic_fetch("graph networks")
+    assert paper_ids == ["c", "a"] and refetched >= fetched
+    # Membership keeps every paper ever saved under the topic
+    assert index.topic_papers("graph networks") == ["b", "a", "c"]
+
+
+def write_legacy(paper_dir, topic: str, papers_info: dict) -> str:
+    os.makedirs(paper_dir / topic, exist_ok=True)
+    path = paper_dir / topic / "papers_info.json"
+    path.write_text(json.dumps(papers_info))
+    return str(path)
+
+
+def test_sync_directory_imports_legacy_topics(tmp_path):
+    papers = tmp_path / "papers"
+    path = write_legacy(papers, "quantum_computing", {"2": paper("Qubits"), "1": paper("Gates")})
+    write_legacy(papers, "broken", {})
+    (papers / "broken" / "papers_info.json").write_text("{not json")
+    (papers / "notes.txt").write_text("not a topic directory")
+    index = PaperIndex(str(papers / "index.sqlite"))
+
+    assert index.sync_directory(str(papers)) == 1
+    assert sorted(index.ids()) == ["1", "2"]
+    assert index.get(["2"])["2"]["title"] == "Qubits"
+    assert index.topic_papers("Quantum Computing") == ["2", "1"]
+    fetched, paper_ids = index.topic_fetch("quantum computing")
+    assert paper_ids == ["2", "1"]
+    assert fetched == os.path.getmtime(path)
+    assert index.search("qubits")[0]["id"] == "2"
+
+    # Unchanged files are skipped; a rewritten one is imported again
+    assert index.sync_directory(str(papers)) == 0
+    write_legacy(papers, "quantum_computing", {"3": paper("Annealing")})
+    os.utime(path, (fetched + 10, fetched + 10))
+    assert index.sync_directory(str(papers)) == 1
+    assert index.topic_papers("quantum computing") == ["2", "1", "3"]
+    assert index.topic_fetch("quantum computing")[1] == ["3"]
+
+
+def test_sync_directory_without_directory(tmp_path):
+    index = PaperIndex(str(tmp_path / "index.sqlite"))
+    assert index.sync_directory(str(tmp_path / "missing")) == 0
+
+
+def test_schema_is_created_once_across_threads(tmp_path, monkeypatch):
+    import sqlite3
+    import paper_index
+    from concurrent.futures import ThreadPoolExecutor
+
+    monkeypatch.setattr(paper_index, "SCHEMA", paper_index.SCHEMA + "CREATE TABLE IF NOT EXISTS inits(n); INSERT INTO inits VALUES (1);")
+    index = PaperIndex(str(tmp_path / "index.sqlite"))
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        assert list(pool.map(lambda _: index.ids(), range(32))) == [[]] * 32
+    with sqlite3.connect(index.db_path) as conn:
+        assert conn.execute("SELECT COUNT(*) FROM inits").fetchone()[0] == 1
+    conn.close()
@@ -0,0 +1,171 @@
+import time
+
+import pytest
+
+import paper_text
+from paper_text import LocalFileFetcher, PaperTextStore, PdfPipeline, find_sections
+
+
+def make_text(length: int) -> str:
+    # Position-dependent, so a read from the wrong offset cannot match by accident
+    return "".join(chr(ord("a") + (i * 7) % 26) for i in range(length))
+
+
+@pytest.fixture
+def small_chunks(monkeypatch):
+    monkeypatch.setattr(paper_text, "CHUNK_CHARS", 10)
+
+
+def test_write_records_chunk_offsets(tmp_path, small_chunks):
+    store = PaperTextStore(str(tmp_path))
+    store.write("2401.00001", make_text(25))
+
+    index = store.load_index("2401.00001")
+    assert index["length"] == 25
+    assert index["chunk_chars"] == 10
+    # One offset per chunk boundary, starting at 0 and ending at the file size
+    assert len(index["offsets"]) == 4
+    assert index["offsets"][0] == 0
+    assert index["offsets"][-1] == (tmp_path / "2401.00001.bin").stat().st_size
+
+
+@pytest.mark.parametrize("offset,length", [
+    (0, 25), (0, 10), (3, 4), (8, 5), (9, 12), (10, 10), (20, 100), (24, 1),
+])
+def test_range_reads(tmp_path, small_chunks, offset, length):
+    text = make_text(25)
+    store = PaperTextStore(str(tmp_path))
+    store.write("2401.00001", text)
+    assert store.read("2401.00001", offset, length) == text[offset:offset + length]
+
+
+def test_reads_use_index_chunk_size(tmp_path, monkeypatch):
+    text = make_text(50)
+    store = PaperTextStore(str(tmp_path))
+    monkeypatch.setattr(paper_text, "CHUNK_CHARS", 10)
+    store.write("2401.00001", text)
+    # Written with one chunk size, read after the default changed
+    monkeypatch.setattr(paper_text, "CHUNK_CHARS", 16)
+    assert store.read("2401.00001", 5, 30) == text[5:35]
+
+
+def test_multibyte_text_is_chunked_by_characters(tmp_path, small_chunks):
+    text = "é" * 15 + "日本語" * 5
+    store = PaperTextStore(str(tmp_path))
+    store.write("2401.00001", text)
+    assert store.read("2401.00001", 0, len(text)) == text
+    assert store.read("2401.00001", 12, 9) == text[12:21]
+
+
+def test_empty_and_out_of_range_reads(tmp_path, small_chunks):
+    store = PaperTextStore(str(tmp_path))
+    store.write("2401.00001", make_text(25))
+    assert store.read("2401.00001", 25, 10) == ""
+    assert store.read("2401.00001", 100, 10) == ""
+    assert store.read("2401.00001", 0, 0) == ""
+    assert store.read("missing", 0, 10) == ""
+    with pytest.raises(ValueError):
+        store.read("2401.00001", -1, 10)
+
+
+def test_old_style_ids_are_stored_safely(tmp_path):
+    store = PaperTextStore(str(tmp_path))
+    store.write("hep-th/9901001", "text")
+    assert store.has("hep-th/9901001")
+    assert (tmp_path / "hep-th_9901001.json").exists()
+    assert store.read("hep-th/9901001", 0, 4) == "text"
+
+
+def test_index_presence_marks_complete_text(tmp_path):
+    store = PaperTextStore(str(tmp_path))
+    assert not store.has("2401.00001")
+    store.write("2401.00001", "text")
+    assert store.has("2401.00001")
+    assert not list(tmp_path.glob("*.tmp"))
+
+
+def test_find_sections():
+    text = "Title\nAbstract\nWe study.\n1 Introduction\nIntro.\n3.1. Method Details\nx\nReferences\n[1] A.\n"
+    sections = find_sections(text)
+    assert [heading for heading, _ in sections] == ["Abstract", "1 Introduction", "3.1. Method Details", "References"]
+    for heading, offset in sections:
+        assert text[offset:offset + len(heading)] == heading
+
+
+def test_section_read_through_stored_offsets(tmp_path, small_chunks):
+    text = "Abstract\n" + make_text(30) + "\n2 Results\n" + make_text(17) + "\nReferences\n[1]\n"
+    store = PaperTextStore(str(tmp_path))
+    store.write("2401.00001", text)
+
+    sections = store.load_index("2401.00001")["sections"]
+    starts = [offset for _, offset in sections] + [len(text)]
+    results = [i for i, (heading, _) in enumerate(sections) if heading == "2 Results"][0]
+    body = store.read("2401.00001", starts[results], starts[results + 1] - starts[results])
+    assert body == "2 Results\n" + make_text(17) + "\n"
+
+
+def wait_for(pipeline: PdfPipeline, paper_id: str) -> None:
+    for _ in range(200):
+        if not pipeline.is_pending(paper_id):
+            return
+        time.sleep(0.01)
+    raise AssertionError(f"{paper_id} still pending")
+
+
+def test_pipeline_with_local_fixtures(tmp_path):
+    fixtures = tmp_path / "pdfs"
+    fixtures.mkdir()
+    (fixtures / "2401.00001.pdf").write_bytes(b"Abstract\nfixture text")
+    store = PaperTextStore(str(tmp_path / "text"))
+    pipeline = PdfPipeline(store, fetcher=LocalFileFetcher(str(fixtures)), extractor=bytes.decode)
+
+    assert pipeline.submit("2401.00001", "https://arxiv.org/pdf/2401.00001")
+    wait_for(pipeline, "2401.00001")
+    assert store.read("2401.00001", 0, 100) == "Abstract\nfixture text"
+    # Stored papers are not fetched again
+    assert not pipeline.submit("2401.00001", "https://arxiv.org/pdf/2401.00001")
+
+    assert pipeline.submit("2401.00002", "https://arxiv.org/pdf/2401.00002")
+    wait_for(pipeline, "2401.00002")
+    assert not store.has("2401.00002")
+    assert "2401.00002" in pipeline.failures
+
+
+def test_pipeline_rejects_when_full(tmp_path):
+    store = PaperTextStore(str(tmp_path))
+    pipeline = PdfPipeline(store, fetcher=lambda paper_id, url: time.sleep(0.2) or b"",
+                           extractor=bytes.decode, max_workers=1, max_pending=1)
+    assert pipeline.submit("a", "url")
+    assert not pipeline.submit("a", "url")
+    assert not pipeline.submit("b", "url")
+    assert not pipeline.submit("c", "")
+    wait_for(pipeline, "a")
+
+
+@pytest.fixture
+def paper_server(tmp_path, monkeypatch):
+    import arxiv_server
+    store = PaperTextStore(str(tmp_path))
+    store.write("p1", "Abstract\n" + "a" * 40 + "\n1 Introduction\n" + "b" * 20 + "\n")
+    monkeypatch.setattr(arxiv_server, "text_store", store)
+    return arxiv_server
+
+
+def test_get_paper_text_ranges(paper_server):
+    assert paper_server._get_paper_text("p1", None, 9, 5) == "aaaaa" + "\n\n[... 72 more characters, continue with offset=14]"
+    assert paper_server._get_paper_text("p1", "introduction", 15, 100) == "b" * 20 + "\n"
+
+
+@pytest.mark.parametrize("offset,length", [(-1, 10), (0, 0), (0, -5)])
+def test_get_paper_text_rejects_invalid_ranges(paper_server, offset, length):
+    assert paper_server._get_paper_text("p1", None, offset, length).startswith("Invalid range")
+
+
+@pytest.mark.parametrize("section,offset,message", [
+    (None, 86, "Offset 86 is past the end of the paper (86 characters)."),
+    (None, 10_000, "Offset 10000 is past the end of the paper (86 characters)."),
+    ("Introduction", 36, "Offset 36 is past the end of section '1 Introduction' (36 characters)."),
+    ("Abstract", 500, "Offset 500 is past the end of section 'Abstract' (50 characters)."),
+])
+def test_get_paper_text_offset_past_end(paper_server, section, offset, message):
+    assert paper_server._get_paper_text("p1", section, offset, 100) == message
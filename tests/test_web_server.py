@@ -0,0 +1,66 @@
+import asyncio
+import json
+import time
+
+import web_server
+from web_server import EventChannel
+
+
+def run(coro):
+    return asyncio.run(coro)
+
+
+class FakeWebSocket:
+    """Records sent frames; fails every send once fail_after frames went out"""
+
+    def __init__(self, fail_after=None):
+        self.fail_after = fail_after
+        self.frames = []
+
+    async def send_text(self, text):
+        if self.fail_after is not None and len(self.frames) >= self.fail_after:
+            raise RuntimeError("connection closed")
+        self.frames.append(json.loads(text))
+
+
+def test_events_and_deltas_keep_their_order():
+    async def scenario():
+        websocket = FakeWebSocket()
+        channel = EventChannel(websocket, coalesce_window=0.01)
+        channel.start()
+        channel.delta("Hel")
+        channel.delta("lo")
+        await channel.send({"type": "tool_progress", "message": "Calling tool"})
+        channel.delta(" again")
+        await channel.close()
+        return websocket.frames
+
+    frames = run(scenario())
+    assert [(frame["type"], frame.get("text")) for frame in frames] == [
+        ("delta", "Hello"), ("tool_progress", None), ("delta", " again")
+    ]
+    assert all(frame["v"] == web_server.PROTOCOL_VERSION for frame in frames)
+
+
+def test_failed_send_closes_channel():
+    async def scenario():
+        websocket = FakeWebSocket(fail_after=1)
+        channel = EventChannel(websocket, max_queue=2)
+        channel.start()
+        await channel.send({"type": "status"})
+        await channel.send({"type": "response"})
+        # Producers blocked on the full queue are released when the sender stops
+        await asyncio.wait_for(asyncio.gather(*(channel.send({"type": "x"}) for _ in range(5))), 1)
+        await asyncio.sleep(0)
+        assert channel.closed
+        assert not channel.send_nowait({"type": "tool_progress"})
+        channel.delta("ignored")
+
+        start = time.monotonic()
+        await channel.close()
+        # No drain wait once the sender has stopped, and its task ended cleanly
+        assert time.monotonic() - start < 0.5
+        assert channel._task.exception() is None
+        return websocket.frames
+
+    assert [frame["type"] for frame in run(scenario())] == ["status"]
@@ -6,6 +6,14 @@ class MCPChatInterface {
         this.isConnected = false;
         this.soundEnabled = true;
         this.messageQueue = [];
+        this.protocolVersion = 2;
+        this.streamingDiv = null;
+        
+        // Transcript model; only the rows near the viewport are in the DOM
+        this.entries = [];
+        this.estimatedRowHeight = 120;
+        this.overscan = 800;
+        this.renderScheduled = false;
         
         this.initializeElements();
         this.setupEventListeners();
@@ -24,6 +32,7 @@ class MCPChatInterface {
         this.chatInput = document.getElementById('chat-input');
         this.sendButton = document.getElementById('send-message');
         this.clearButton = document.getElementById('clear-chat');
+        this.stopButton = document.getElementById('stop-query');
         this.soundButton = document.getElementById('toggle-sound');
         this.charCount = document.getElementById('char-count');
         this.lastUpdated = document.getElementById('last-updated');
@@ -31,6 +40,14 @@ class MCPChatInterface {
         
         // Tool progress tracking
         this.toolProgressDiv = null;
+        
+        // Virtualized transcript: spacers stand in for the rows scrolled out of view,
+        // and in-flight indicators (loading, tool progress, streaming) live below it
+        this.topSpacer = document.createElement('div');
+        this.windowEl = document.createElement('div');
+        this.bottomSpacer = document.createElement('div');
+        this.liveArea = document.createElement('div');
+        this.chatMessages.append(this.topSpacer, this.windowEl, this.bottomSpacer, this.liveArea);
     }
     
     setupEventListeners() {
@@ -60,12 +77,27 @@ class MCPChatInterface {
             }
         });
         
+        // Stop the query in progress (button or Escape)
+        this.stopButton.addEventListener('click', () => this.stopQuery());
+        this.chatInput.addEventListener('keydown', (e) => {
+            if (e.key === 'Escape') {
+                this.stopQuery();
+            }
+        });
+        
         // Clear chat history
         this.clearButton.addEventListener('click', () => this.clearChat());
         
         // Toggle sound
         this.soundButton.addEventListener('click', () => this.toggleSound());
         
+        // Re-render the visible window at most once per frame
+        this.chatMessages.addEventListener('scroll', () => this.scheduleRender(), { passive: true });
+        window.addEventListener('resize', () => {
+            this.entries.forEach(entry => { entry.height = null; });
+            this.scheduleRender();
+        });
+        
         // Auto-focus on input
         this.chatInput.focus();
     }
@@ -85,6 +117,12 @@ class MCPChatInterface {
                 this.updateConnectionStatus('CONNECTED', '#00ff41');
                 this.playSound('connect');
                 
+                // Pick up the stored conversation (after a reload, reconnect or server restart)
+                this.socket.send(JSON.stringify({
+                    type: 'resume',
+                    session_id: localStorage.getItem('mcpSessionId')
+                }));
+                
                 // Send queued messages
                 this.processMessageQueue();
             };
@@ -117,19 +155,31 @@ class MCPChatInterface {
     }
     
     handleMessage(data) {
+        if (data.v !== undefined && data.v !== this.protocolVersion) {
+            console.warn(`Server protocol v${data.v}, client expects v${this.protocolVersion}`);
+        }
+        
         switch (data.type) {
             case 'status':
                 this.handleStatusMessage(data);
                 break;
+            case 'session':
+                this.handleSessionMessage(data);
+                break;
             case 'user_message':
                 this.addMessage('user', data.message);
                 break;
+            case 'delta':
+                this.appendDelta(data.text);
+                break;
             case 'assistant_message':
                 // Remove tool progress indicator when response arrives
                 if (this.toolProgressDiv) {
                     this.toolProgressDiv.remove();
                     this.toolProgressDiv = null;
                 }
+                // The final message replaces the streamed preview
+                this.endStreaming();
                 
                 // Combine message and token info if present
                 let fullMessage = data.message;
@@ -140,11 +190,31 @@ class MCPChatInterface {
                 this.addMessage('assistant', fullMessage);
                 this.playSound('message');
                 break;
+            case 'tool_result':
+                this.addMessage('tool', data.preview, {
+                    tool: data.tool,
+                    resultId: data.result_id,
+                    length: data.length
+                });
+                break;
+            case 'tool_result_content':
+                this.handleToolResultContent(data);
+                break;
             case 'tool_progress':
                 this.showToolProgress(data.message);
                 this.playSound('send');
                 break;
+            case 'cancelled':
+                // Partial text of the cancelled turn goes either way
+                this.endStreaming();
+                // A superseded query's indicators now belong to the new query
+                if (!data.superseded) {
+                    this.clearPendingIndicators();
+                }
+                this.addMessage('system', data.message);
+                break;
             case 'error':
+                this.endStreaming();
                 this.addMessage('error', data.message);
                 this.playSound('error');
                 break;
@@ -173,6 +243,17 @@ class MCPChatInterface {
         }
     }
     
+    handleSessionMessage(data) {
+        localStorage.setItem('mcpSessionId', data.session_id);
+        
+        // Only rebuild the transcript on a fresh page; a reconnect already shows it
+        const shown = this.entries.some(entry => entry.type === 'user' || entry.type === 'assistant');
+        if (shown || !data.messages.length) return;
+        
+        data.messages.forEach(msg => this.pushEntry(msg.role, msg.content, { fresh: false }));
+        this.addMessage('system', `📂 Resumed conversation (${data.messages.length} messages)`);
+    }
+    
     sendMessage() {
         if (!this.isConnected) {
             this.addMessage('error', 'Not connected to server. Please wait for reconnection.');
@@ -197,7 +278,7 @@ class MCPChatInterface {
         this.charCount.textContent = '0';
         
         // Show loading message
-        this.addMessage('assistant', 'Processing your request<span class="loading"></span>');
+        this.showLoading();
         
         // Re-enable send button after a short delay
         setTimeout(() => {
@@ -208,47 +289,195 @@ class MCPChatInterface {
         this.playSound('send');
     }
     
-    addMessage(type, content) {
-        const messageDiv = document.createElement('div');
-        messageDiv.className = `message ${type}-message`;
-        
-        const timestamp = new Date().toLocaleTimeString();
-        
+    addMessage(type, content, extra = {}) {
         // Remove loading message if this is an assistant response
         if (type === 'assistant') {
-            const loadingMessages = this.chatMessages.querySelectorAll('.assistant-message .loading');
-            loadingMessages.forEach(msg => msg.closest('.message').remove());
+            this.removeLoading();
         }
         
-        const messageHeader = this.getMessageHeader(type);
+        this.pushEntry(type, content, extra);
+        this.scrollToBottom();
+    }
+    
+    pushEntry(type, content, extra = {}) {
+        // Add to the transcript without rendering; callers render once per batch
+        this.entries.push({
+            type,
+            content: content || '',
+            timestamp: new Date().toLocaleTimeString(),
+            fresh: true,
+            ...extra,
+            // Formatted once, on first render; height measured once rendered
+            html: null,
+            node: null,
+            height: null
+        });
+    }
+    
+    showLoading() {
+        const loadingDiv = document.createElement('div');
+        loadingDiv.className = 'message assistant-message';
+        loadingDiv.innerHTML = `
+            <div class="message-header">${this.getMessageHeader('assistant')}</div>
+            <div class="message-content">Processing your request<span class="loading"></span></div>
+        `;
+        this.liveArea.appendChild(loadingDiv);
+        this.scrollToBottom();
+    }
+    
+    removeLoading() {
+        const loadingMessages = this.liveArea.querySelectorAll('.assistant-message .loading');
+        loadingMessages.forEach(msg => msg.closest('.message').remove());
+    }
+    
+    rowHeight(entry) {
+        return entry.height === null ? this.estimatedRowHeight : entry.height;
+    }
+    
+    scheduleRender() {
+        if (this.renderScheduled) return;
+        this.renderScheduled = true;
+        requestAnimationFrame(() => {
+            this.renderScheduled = false;
+            this.renderWindow();
+        });
+    }
+    
+    renderWindow() {
+        // Viewport in transcript coordinates, widened by the overscan margin
+        const origin = this.topSpacer.offsetTop;
+        const top = this.chatMessages.scrollTop - origin - this.overscan;
+        const bottom = this.chatMessages.scrollTop - origin + this.chatMessages.clientHeight + this.overscan;
+        
+        let start = 0;
+        let offset = 0;
+        while (start < this.entries.length && offset + this.rowHeight(this.entries[start]) < top) {
+            offset += this.rowHeight(this.entries[start]);
+            start++;
+        }
+        let end = start;
+        let windowBottom = offset;
+        while (end < this.entries.length && windowBottom < bottom) {
+            windowBottom += this.rowHeight(this.entries[end]);
+            end++;
+        }
+        let rest = 0;
+        for (let i = end; i < this.entries.length; i++) {
+            rest += this.rowHeight(this.entries[i]);
+        }
         
-        const messageContent = this.formatMessage(content);
+        // Drop the nodes of rows that left the window so their memory can be reclaimed
+        const visible = this.entries.slice(start, end);
+        Array.from(this.windowEl.children).forEach(node => {
+            if (!visible.includes(node.entry)) {
+                node.entry.node = null;
+            }
+        });
+        this.windowEl.replaceChildren(...visible.map(entry => entry.node || this.renderRow(entry)));
         
-        // Debug logging (can be removed in production)
-        if (type === 'assistant' && content.length > 500) {
-            console.log('📝 Long assistant message:', content.length + ' characters');
-        }
+        this.topSpacer.style.height = `${offset}px`;
+        this.bottomSpacer.style.height = `${rest}px`;
+        visible.forEach(entry => {
+            entry.height = entry.node.offsetHeight;
+        });
+    }
+    
+    renderRow(entry) {
+        // flow-root keeps the message margin inside the row, so offsetHeight covers it
+        const row = document.createElement('div');
+        row.className = 'transcript-row';
+        row.entry = entry;
+        entry.node = row;
         
+        const messageDiv = document.createElement('div');
+        messageDiv.className = `message ${entry.type}-message`;
         messageDiv.innerHTML = `
-            <div class="message-header">${messageHeader}</div>
-            <div class="message-content">${messageContent}</div>
-            <div class="message-timestamp">${timestamp}</div>
+            <div class="message-header">${this.getMessageHeader(entry.type, entry)}</div>
+            <div class="message-content"></div>
+            <div class="message-timestamp">${entry.timestamp}</div>
         `;
         
-        // Ensure the content div has proper styling
         const contentDiv = messageDiv.querySelector('.message-content');
-        contentDiv.style.maxHeight = 'none';
-        contentDiv.style.height = 'auto';
-        contentDiv.style.overflow = 'visible';
-        contentDiv.style.wordWrap = 'break-word';
-        contentDiv.style.whiteSpace = 'pre-wrap';
-        
-        this.chatMessages.appendChild(messageDiv);
-        this.scrollToBottom();
+        if (entry.type === 'tool') {
+            // Tool output is shown verbatim, never parsed as HTML
+            contentDiv.textContent = entry.expanded ? entry.full : entry.content;
+            if (entry.length > entry.content.length) {
+                const toggle = document.createElement('button');
+                toggle.className = 'retro-button tool-result-toggle';
+                toggle.textContent = entry.expanded
+                    ? '⬆ COLLAPSE'
+                    : `⬇ LOAD FULL RESULT (${entry.length.toLocaleString()} chars)`;
+                toggle.addEventListener('click', () => this.toggleToolResult(entry));
+                messageDiv.appendChild(toggle);
+            }
+        } else {
+            if (entry.html === null) {
+                entry.html = this.formatMessage(entry.content);
+            }
+            contentDiv.innerHTML = entry.html;
+        }
         
         // Add typing animation for new messages
-        if (type === 'assistant') {
-            messageDiv.querySelector('.message-content').classList.add('typing');
+        if (entry.fresh && entry.type === 'assistant') {
+            contentDiv.classList.add('typing');
+        }
+        entry.fresh = false;
+        
+        row.appendChild(messageDiv);
+        return row;
+    }
+    
+    rerenderEntry(entry) {
+        entry.node = null;
+        entry.height = null;
+        this.renderWindow();
+    }
+    
+    toggleToolResult(entry) {
+        if (entry.expanded) {
+            entry.expanded = false;
+            this.rerenderEntry(entry);
+        } else if (entry.full !== undefined) {
+            entry.expanded = true;
+            this.rerenderEntry(entry);
+        } else if (this.isConnected) {
+            // Full results stay on the server until asked for
+            this.socket.send(JSON.stringify({
+                type: 'tool_result_content',
+                result_id: entry.resultId
+            }));
+        }
+    }
+    
+    handleToolResultContent(data) {
+        const entry = this.entries.find(e => e.type === 'tool' && e.resultId === data.result_id);
+        if (!entry) return;
+        entry.full = data.content;
+        entry.expanded = true;
+        this.rerenderEntry(entry);
+    }
+    
+    appendDelta(text) {
+        // Append streamed text as a plain text node: no re-parsing of what is already shown
+        if (!this.streamingDiv) {
+            this.removeLoading();
+            
+            this.streamingDiv = document.createElement('div');
+            this.streamingDiv.className = 'message assistant-message streaming';
+            this.streamingDiv.innerHTML = `
+                <div class="message-header">${this.getMessageHeader('assistant')}</div>
+                <div class="message-content" style="white-space: pre-wrap; word-wrap: break-word;"></div>
+            `;
+            this.liveArea.appendChild(this.streamingDiv);
+        }
+        this.streamingDiv.querySelector('.message-content').appendChild(document.createTextNode(text));
+        this.scrollToBottom();
+    }
+    
+    endStreaming() {
+        if (this.streamingDiv) {
+            this.streamingDiv.remove();
+            this.streamingDiv = null;
         }
     }
     
@@ -274,7 +503,7 @@ class MCPChatInterface {
             <div class="message-timestamp">${timestamp}</div>
         `;
         
-        this.chatMessages.appendChild(this.toolProgressDiv);
+        this.liveArea.appendChild(this.toolProgressDiv);
         this.scrollToBottom();
     }
     
@@ -288,10 +517,11 @@ class MCPChatInterface {
         return message;
     }
     
-    getMessageHeader(type) {
+    getMessageHeader(type, entry = {}) {
         const headers = {
             'user': '👤 USER',
             'assistant': '🤖 ASSISTANT',
+            'tool': `🔧 TOOL RESULT${entry.tool ? ` · ${entry.tool}` : ''}`,
             'system': '🖥️ SYSTEM',
             'error': '❌ ERROR'
         };
@@ -329,6 +559,25 @@ class MCPChatInterface {
         return formatted;
     }
     
+    stopQuery() {
+        if (!this.isConnected) return;
+        
+        this.socket.send(JSON.stringify({
+            type: 'stop'
+        }));
+    }
+    
+    clearPendingIndicators() {
+        // Drop the loading message and tool progress of a cancelled query
+        this.removeLoading();
+        
+        if (this.toolProgressDiv) {
+            this.toolProgressDiv.remove();
+            this.toolProgressDiv = null;
+        }
+        this.endStreaming();
+    }
+    
     clearChat() {
         if (!this.isConnected) {
             this.addMessage('error', 'Cannot clear chat while disconnected.');
@@ -341,8 +590,9 @@ class MCPChatInterface {
         }));
         
         // Clear local chat display
-        const messages = this.chatMessages.querySelectorAll('.message:not(.welcome-message)');
-        messages.forEach(msg => msg.remove());
+        this.entries = [];
+        this.clearPendingIndicators();
+        this.renderWindow();
         
         this.playSound('clear');
     }
@@ -399,6 +649,9 @@ class MCPChatInterface {
     
     
     scrollToBottom() {
+        // Render at the bottom, then settle once rows there have been measured
+        this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
+        this.renderWindow();
         this.chatMessages.scrollTop = this.chatMessages.scrollHeight;
     }
     
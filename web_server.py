@@ -2,24 +2,80 @@ from fastapi import FastAPI, WebSocket, WebSocketDisconnect
 from fastapi.staticfiles import StaticFiles
 from fastapi.responses import HTMLResponse
 import asyncio
+import builtins
+import contextvars
 import json
 import os
 import sys
+import uuid
 from contextlib import AsyncExitStack
 from pathlib import Path
+from collections import Counter, OrderedDict
+from typing import Optional
 
 # Add application directory to path for imports
 sys.path.append(os.path.join(os.path.dirname(__file__), "application"))
 
 from multi_server_chatbot import MCP_ChatBot
+from conversation_store import ConversationStore
 
-# Global chatbot instance
+# Global chatbot instance: owns the server connections; conversations run on forks of it
 chatbot_instance = None
 chatbot_initialized = False
+chat_sessions = None
+
+# Print capture of the turn running in the current task (and the tasks it starts)
+_turn_print: contextvars.ContextVar = contextvars.ContextVar("turn_print", default=None)
+_builtin_print = builtins.print
+
+def _routed_print(*args, **kwargs):
+    """Send a print to the capture of the turn that made it, if any"""
+    capture = _turn_print.get()
+    if capture is None:
+        return _builtin_print(*args, **kwargs)
+    return capture(*args, **kwargs)
+
+class ChatSessions:
+    """One MCP_ChatBot per conversation, all sharing the base bot's server connections.
+    
+    Bots are reference-counted by the connections using them and dropped
+    when the last one leaves. Turns on the same conversation (e.g. two
+    tabs) take the conversation's lock, so they never interleave.
+    """
+    
+    def __init__(self, base: MCP_ChatBot):
+        self.base = base
+        self._bots: dict = {}
+        self._locks: dict = {}
+        self._users: Counter = Counter()
+    
+    async def acquire(self, session_id: str) -> MCP_ChatBot:
+        """Bot for session_id, loading its history on first use (ValueError for a bad id)"""
+        if session_id not in self._bots:
+            bot = self.base.fork()
+            await bot.resume(session_id)
+            # Another connection may have loaded it while we waited
+            if session_id not in self._bots:
+                self._bots[session_id] = bot
+                self._locks[session_id] = asyncio.Lock()
+        self._users[session_id] += 1
+        return self._bots[session_id]
+    
+    def lock(self, session_id: str) -> asyncio.Lock:
+        return self._locks[session_id]
+    
+    def release(self, session_id: str) -> None:
+        self._users[session_id] -= 1
+        if self._users[session_id] <= 0:
+            del self._users[session_id]
+            self._locks.pop(session_id, None)
+            bot = self._bots.pop(session_id, None)
+            if bot is not None:
+                bot.end_session()
 
 async def startup_event():
     """Initialize the chatbot when the server starts"""
-    global chatbot_instance, chatbot_initialized
+    global chatbot_instance, chatbot_initialized, chat_sessions
     
     print("🚀 Starting MCP Chatbot Web Server...")
     
@@ -28,17 +84,21 @@ async def startup_event():
         with open("server_config.json", "r") as f:
             config = json.load(f)
         
-        chatbot_instance = MCP_ChatBot()
+        # Histories persist under sessions/ so reconnects and restarts can resume
+        chatbot_instance = MCP_ChatBot(store=ConversationStore())
         
         # Connect to all servers - handle nested structure
         if "mcpServers" in config:
             servers_config = config["mcpServers"]
         else:
             servers_config = config
-            
-        for server_name, server_config in servers_config.items():
-            print(f"Connecting to {server_name}...")
-            await chatbot_instance.connect_to_server(server_name, server_config)
+        
+        # Servers with a valid catalog snapshot start lazily on first use
+        await chatbot_instance.connect_to_servers(servers_config)
+        
+        chat_sessions = ChatSessions(chatbot_instance)
+        # Turns print their replies; route each print to its own turn's capture
+        builtins.print = _routed_print
         
         print("✅ All servers connected successfully!")
         chatbot_initialized = True
@@ -55,8 +115,10 @@ async def lifespan(app: FastAPI):
     # Startup
     await startup_event()
     yield
-    # Shutdown (cleanup if needed)
-    pass
+    # Shutdown
+    builtins.print = _builtin_print
+    if chatbot_instance:
+        await chatbot_instance.cleanup()
 
 app = FastAPI(title="MCP Chatbot Web Interface", lifespan=lifespan)
 
@@ -69,28 +131,256 @@ async def get_chat_page():
     with open("web/index.html", "r") as f:
         return HTMLResponse(f.read())
 
+# Bump when event shapes change; every server event carries it as "v"
+PROTOCOL_VERSION = 2
+
+# Tool results longer than this are sent as a preview; the rest is fetched on demand
+TOOL_PREVIEW_CHARS = 600
+# Full tool results kept per connection for on-demand loading
+MAX_TOOL_RESULTS = 200
+
+# Sentinel queued to make the sender flush coalesced delta text
+_FLUSH_DELTA = object()
+
+class EventChannel:
+    """Single sender for one WebSocket connection.
+    
+    Events go through a bounded queue drained by one task, so sends never
+    interleave and a slow client pushes back on the producer instead of
+    piling up tasks. Streamed text ("delta" events) is buffered and sent
+    as one frame per coalesce window.
+    """
+    
+    def __init__(self, websocket: WebSocket, max_queue: int = 64, coalesce_window: float = 0.05):
+        self.websocket = websocket
+        self.coalesce_window = coalesce_window
+        self._queue: asyncio.Queue = asyncio.Queue(max_queue)
+        # Items are queued as (sequence, event) so deltas keep their place in the stream
+        self._sequence = 0
+        # Pending streamed text as [sequence it follows, parts] segments
+        self._delta: list = []
+        self._delta_scheduled = False
+        self._task: Optional[asyncio.Task] = None
+        # Set when a send fails; everything after that is dropped
+        self.closed = False
+    
+    def start(self):
+        self._task = asyncio.create_task(self._run())
+    
+    def _next(self, event) -> tuple:
+        self._sequence += 1
+        return (self._sequence, event)
+    
+    async def send(self, event: dict):
+        """Queue an event, waiting while the client is behind"""
+        if self.closed:
+            return
+        await self._queue.put(self._next(event))
+    
+    def send_nowait(self, event: dict) -> bool:
+        """Queue an advisory event from sync code; dropped if the client is behind"""
+        if self.closed or self._queue.full():
+            return False
+        self._queue.put_nowait(self._next(event))
+        return True
+    
+    def delta(self, text: str):
+        """Append streamed text; sent with whatever else arrives within the window"""
+        if self.closed:
+            return
+        if self._delta and self._delta[-1][0] == self._sequence:
+            self._delta[-1][1].append(text)
+        else:
+            # Something was queued since the last text, so it has to go out in between
+            self._delta.append([self._sequence, [text]])
+        if not self._delta_scheduled:
+            self._delta_scheduled = True
+            asyncio.get_running_loop().call_later(self.coalesce_window, self._request_delta_flush)
+    
+    def _request_delta_flush(self):
+        if not self._delta or self._task is None or self._task.done():
+            # Already sent ahead of a later event, or the connection is gone
+            self._delta_scheduled = False
+        elif self._queue.full():
+            # Try again next window; the flag stays set so delta() doesn't schedule twice
+            asyncio.get_running_loop().call_later(self.coalesce_window, self._request_delta_flush)
+        else:
+            self._queue.put_nowait(self._next(_FLUSH_DELTA))
+    
+    async def _write(self, event: dict):
+        await self.websocket.send_text(json.dumps({"v": PROTOCOL_VERSION, **event}, separators=(",", ":")))
+    
+    async def _flush_delta(self, before: float):
+        """Send the streamed text that was produced ahead of sequence number before"""
+        while self._delta and self._delta[0][0] < before:
+            _, parts = self._delta.pop(0)
+            await self._write({"type": "delta", "text": "".join(parts)})
+    
+    async def _run(self):
+        while True:
+            sequence, event = await self._queue.get()
+            try:
+                await self._flush_delta(sequence)
+                if event is _FLUSH_DELTA:
+                    self._delta_scheduled = False
+                else:
+                    await self._write(event)
+            except Exception as e:
+                # The client is gone: stop sending, and free producers blocked on a full queue
+                print(f"WebSocket send failed: {e}", file=sys.stderr)
+                self.closed = True
+                self._delta.clear()
+                while not self._queue.empty():
+                    self._queue.get_nowait()
+                    self._queue.task_done()
+                return
+            finally:
+                self._queue.task_done()
+    
+    async def close(self):
+        """Send what is queued (briefly), then stop the sender"""
+        if self._task is None:
+            return
+        if self._task.done():
+            return  # sender already stopped on a failed send
+        try:
+            await asyncio.wait_for(self._drain(), timeout=1.0)
+        except Exception:
+            pass  # client is gone or too slow; drop the rest
+        self._task.cancel()
+    
+    async def _drain(self):
+        await self._queue.put(self._next(_FLUSH_DELTA))
+        await self._queue.join()
+
 @app.websocket("/ws")
 async def websocket_endpoint(websocket: WebSocket):
     """WebSocket endpoint for real-time chat"""
     await websocket.accept()
+    channel = EventChannel(websocket)
+    channel.start()
     
     if not chatbot_initialized:
-        await websocket.send_text(json.dumps({
+        await channel.send({
             "type": "error",
             "message": "Chatbot not initialized. Please try again later."
-        }))
+        })
+        await channel.close()
         await websocket.close()
         return
     
     # Send initialization message
-    await websocket.send_text(json.dumps({
+    await channel.send({
         "type": "status",
+        "protocol": PROTOCOL_VERSION,
         "message": f"🤖 Connected to {chatbot_instance.llm_adapter.provider_name} using {chatbot_instance.llm_adapter.model}",
         "provider": chatbot_instance.llm_adapter.provider_name,
         "model": chatbot_instance.llm_adapter.model,
         "caching": chatbot_instance.llm_adapter.enable_caching,
         "tools": len(chatbot_instance.available_tools)
-    }))
+    })
+    
+    async def run_turn(bot: MCP_ChatBot, lock: asyncio.Lock, query: str):
+        """Process one query and send the captured response"""
+        try:
+            # Capture the chatbot response with streaming
+            original_print = _builtin_print
+            current_message = ""
+            token_info = ""
+            
+            def capture_print(*args, **kwargs):
+                nonlocal current_message, token_info
+                # Logging to stderr/files is not part of the reply
+                if kwargs.get("file") not in (None, sys.stdout):
+                    return original_print(*args, **kwargs)
+                line = " ".join(str(arg) for arg in args)
+                
+                # Check if this is token information
+                if "🔢 Tokens:" in line:
+                    token_info = line
+                    # Use original_print to avoid recursion
+                    original_print(f"🔍 Captured token info: {token_info}")
+                # Check if this is a tool call
+                elif "Calling tool" in line and "with args" in line:
+                    # Progress is advisory: skip it rather than queue behind a slow client
+                    if not channel.send_nowait({
+                        "type": "tool_progress",
+                        "message": line
+                    }):
+                        chatbot_instance.metrics['ws_events_dropped'] += 1
+                    # Add to current message
+                    if current_message:
+                        current_message += "\n" + line
+                    else:
+                        current_message = line
+                else:
+                    # Stream the text now; the final message replaces it
+                    channel.delta(("\n" if current_message else "") + line)
+                    # Add to current message
+                    if current_message:
+                        current_message += "\n" + line
+                    else:
+                        current_message = line
+                
+                original_print(*args, **kwargs)
+            
+            async def send_tool_result(tool_name: str, tool_args: dict, content: str):
+                nonlocal next_result_id
+                next_result_id += 1
+                tool_results[next_result_id] = content
+                if len(tool_results) > MAX_TOOL_RESULTS:
+                    tool_results.popitem(last=False)
+                await channel.send({
+                    "type": "tool_result",
+                    "result_id": next_result_id,
+                    "tool": tool_name,
+                    "preview": content[:TOOL_PREVIEW_CHARS],
+                    "length": len(content)
+                })
+            
+            # Capture prints made by this task only; it runs in its own context
+            _turn_print.set(capture_print)
+            
+            async with lock:
+                await bot.process_query(query, on_tool_result=send_tool_result)
+            
+            # Send the response with token info if available
+            if current_message:
+                response_data = {
+                    "type": "assistant_message",
+                    "message": current_message
+                }
+                
+                # Add token info if available
+                if token_info:
+                    response_data["tokens"] = token_info
+                
+                await channel.send(response_data)
+            
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            await channel.send({
+                "type": "error", 
+                "message": f"Error processing query: {str(e)}"
+            })
+    
+    # The turn in flight for this connection; cancelled on stop, supersede or disconnect
+    current_turn: Optional[asyncio.Task] = None
+    # Conversation this connection reads and writes; the client may resume an older one
+    session_id = uuid.uuid4().hex
+    bot = await chat_sessions.acquire(session_id)
+    # Full tool results behind the previews already sent, oldest evicted first
+    tool_results: OrderedDict = OrderedDict()
+    next_result_id = 0
+    
+    async def cancel_turn() -> bool:
+        """Cancel the running turn and wait for it to unwind"""
+        if current_turn is None or current_turn.done():
+            return False
+        current_turn.cancel()
+        await asyncio.wait([current_turn])
+        return True
     
     try:
         while True:
@@ -104,92 +394,90 @@ async def websocket_endpoint(websocket: WebSocket):
                 if not query:
                     continue
                 
+                # A new query supersedes the one still running
+                if await cancel_turn():
+                    await channel.send({
+                        "type": "cancelled",
+                        "message": "⏹️ Previous query superseded",
+                        "superseded": True
+                    })
+                
                 # Send user message back to client for display
-                await websocket.send_text(json.dumps({
+                await channel.send({
                     "type": "user_message",
                     "message": query
-                }))
+                })
                 
-                # Process the query
-                try:
-                    # Capture the chatbot response with streaming
-                    original_print = print
-                    current_message = ""
-                    token_info = ""
-                    
-                    def capture_print(*args, **kwargs):
-                        nonlocal current_message, token_info
-                        line = " ".join(str(arg) for arg in args)
-                        
-                        # Check if this is token information
-                        if "🔢 Tokens:" in line:
-                            token_info = line
-                            # Use original_print to avoid recursion
-                            original_print(f"🔍 Captured token info: {token_info}")
-                        # Check if this is a tool call
-                        elif "Calling tool" in line and "with args" in line:
-                            # Store tool info for later sending
-                            asyncio.create_task(websocket.send_text(json.dumps({
-                                "type": "tool_progress",
-                                "message": line
-                            })))
-                            # Add to current message
-                            if current_message:
-                                current_message += "\n" + line
-                            else:
-                                current_message = line
-                        else:
-                            # Add to current message
-                            if current_message:
-                                current_message += "\n" + line
-                            else:
-                                current_message = line
-                        
-                        original_print(*args, **kwargs)
-                    
-                    # Temporarily replace print to capture output
-                    import builtins
-                    builtins.print = capture_print
-                    
+                # Run the turn in the background so stop/disconnect can interrupt it
+                current_turn = asyncio.create_task(run_turn(bot, chat_sessions.lock(session_id), query))
+            
+            elif message_data.get("type") == "resume":
+                await cancel_turn()
+                requested = message_data.get("session_id")
+                if requested and requested != session_id:
                     try:
-                        await chatbot_instance.process_query(query)
-                    finally:
-                        # Restore original print
-                        builtins.print = original_print
-                    
-                    # Send the response with token info if available
-                    if current_message:
-                        response_data = {
-                            "type": "assistant_message",
-                            "message": current_message
-                        }
-                        
-                        # Add token info if available
-                        if token_info:
-                            response_data["tokens"] = token_info
-                        
-                        await websocket.send_text(json.dumps(response_data))
-                    
-                except Exception as e:
-                    await websocket.send_text(json.dumps({
-                        "type": "error", 
-                        "message": f"Error processing query: {str(e)}"
-                    }))
+                        bot = await chat_sessions.acquire(requested)
+                        chat_sessions.release(session_id)
+                        session_id = requested
+                    except ValueError:
+                        pass  # keep the current conversation
+                
+                await channel.send({
+                    "type": "session",
+                    "session_id": session_id,
+                    "messages": [
+                        {"role": msg.role, "content": msg.content}
+                        for msg in bot.conversation_history
+                        if msg.role in ("user", "assistant") and msg.content
+                    ]
+                })
+            
+            elif message_data.get("type") == "tool_result_content":
+                result_id = message_data.get("result_id")
+                content = tool_results.get(result_id)
+                await channel.send({
+                    "type": "tool_result_content",
+                    "result_id": result_id,
+                    "content": content if content is not None else "⚠️ Result no longer available"
+                })
+            
+            elif message_data.get("type") == "stop":
+                stopped = await cancel_turn()
+                await channel.send({
+                    "type": "cancelled" if stopped else "status",
+                    "message": "⏹️ Query stopped" if stopped else "No query in progress"
+                })
             
             elif message_data.get("type") == "clear":
-                # Clear conversation history
-                chatbot_instance.conversation_history = []
-                await websocket.send_text(json.dumps({
+                await cancel_turn()
+                # Clear conversation history, after any turn another tab has running on it
+                async with chat_sessions.lock(session_id):
+                    bot.conversation_history = []
+                    bot.save_history()
+                await channel.send({
                     "type": "status",
                     "message": "🧹 Conversation history cleared"
-                }))
+                })
     
     except WebSocketDisconnect:
         print("Client disconnected")
     except Exception as e:
         print(f"WebSocket error: {e}")
+    finally:
+        # Don't keep spending tokens on a turn nobody will read
+        await cancel_turn()
+        chat_sessions.release(session_id)
+        await channel.close()
+
+@app.get("/metrics")
+async def get_metrics():
+    """Counters for cancelled and otherwise wasted work"""
+    if not chatbot_initialized:
+        return {}
+    return dict(chatbot_instance.metrics)
 
 if __name__ == "__main__":
     import uvicorn
     print("🌐 Starting MCP Chatbot Web Server on http://localhost:8000")
-    uvicorn.run(app, host="0.0.0.0", port=8000)
\ No newline at end of file
+    # permessage-deflate compresses large tool payloads on the wire
+    uvicorn.run(app, host="0.0.0.0", port=8000, ws_per_message_deflate=True)
\ No newline at end of file